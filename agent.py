@@ -7,16 +7,53 @@ from dotenv import load_dotenv
 # Cargar variables de entorno del archivo .env
 load_dotenv()
 
+# Backend del modelo: "gemini" (default) o "stub" para desarrollo/benchmarks sin API key
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini').lower()
+
 # Verificar que la API key esté cargada
-if not os.getenv('GOOGLE_API_KEY'):
+if LLM_BACKEND != 'stub' and not os.getenv('GOOGLE_API_KEY'):
     raise ValueError("❌ GOOGLE_API_KEY no encontrada en .env. Por favor configura tu API key.")
 
+import asyncio
 from google.adk.agents import Agent
 from config import TenantConfig, load_tenant_config
+import profiling
+from profiling import span
 from prompts import get_system_prompt
+from resilience import (
+    DEGRADED_REPLY, TIMEOUT_REPLY, CircuitBreaker, HedgedLlm, HedgingPolicy
+)
+from structured_logging import get_logger
 from tools import crm_tools, calendar_tools
 
 
+logger = get_logger(__name__)
+
+
+# Tiempo máximo por turno antes de responder con un fallback
+TURN_DEADLINE_SECONDS = float(os.getenv('TURN_DEADLINE_SECONDS', '20'))
+
+# Hedging de llamadas lentas al LLM (opcional: duplica llamadas y consume cuota)
+LLM_HEDGE_ENABLED = os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true'
+
+# Compartidos por todas las sesiones del proceso (la cuota de Gemini es una sola)
+hedging_policy = HedgingPolicy.from_env()
+llm_circuit_breaker = CircuitBreaker.from_env()
+
+
+def _get_model():
+    """Modelo según LLM_BACKEND (nombre de Gemini o instancia del stub)"""
+    if LLM_BACKEND == 'stub':
+        from stub_llm import StubLlm
+        model = StubLlm.from_env()
+    else:
+        model = "gemini-2.0-flash"
+    
+    if LLM_HEDGE_ENABLED:
+        return HedgedLlm.wrap(model, hedging_policy)
+    return model
+
+
 def create_inbound_agent(tenant_id: str = "default") -> Agent:
     """
     Crea un agente inbound personalizado según la configuración del tenant.
@@ -31,23 +68,31 @@ def create_inbound_agent(tenant_id: str = "default") -> Agent:
     config = load_tenant_config(tenant_id)
     
     # Genera el system prompt personalizado
-    system_prompt = get_system_prompt(config)
+    with span("prompt.build"):
+        system_prompt = get_system_prompt(config)
     
     # Define las herramientas disponibles para el agente
     tools = [
         crm_tools.save_to_crm,
         crm_tools.get_prospect_info,
         calendar_tools.schedule_meeting,
-        calendar_tools.check_availability
+        calendar_tools.check_availability,
+        calendar_tools.find_available_slots,
+        calendar_tools.book_first_available
     ]
     
     # Crea el agente con Google ADK
     agent = Agent(
         name="inbound_bant_agent",
-        model="gemini-2.0-flash",
+        model=_get_model(),
         instruction=system_prompt,
         description="Agente de calificación BANT para prospectos inbound",
-        tools=tools
+        tools=tools,
+        # Spans del LLM y de cada tool cuando el request se está perfilando
+        before_model_callback=profiling.before_model_callback,
+        after_model_callback=profiling.after_model_callback,
+        before_tool_callback=profiling.before_tool_callback,
+        after_tool_callback=profiling.after_tool_callback
     )
     
     return agent
@@ -75,6 +120,13 @@ class InboundAgentSession:
         self.qualified = None
         self.meeting_scheduled = False
         
+        # Tools llamadas en el último turno (para logs)
+        self.last_tool_calls = []
+        
+        # Resumen del CRM precargado por el webhook ("" = prospecto nuevo,
+        # None = no se buscó). Se copia al estado ADK al crear la sesión.
+        self.prospect_context = None
+        
         # Inicializar runner y sesión
         self._initialize_session()
     
@@ -93,14 +145,26 @@ class InboundAgentSession:
         self.session_id = f"session_{self.user_id}"
         self.session_initialized = False
     
+    def _initial_state(self) -> dict:
+        """
+        Estado inicial de la sesión ADK. Las tools lo leen vía tool_context y
+        la instrucción del agente inserta {prospect_context?}.
+        """
+        state = {"tenant_id": self.tenant_id}
+        if self.prospect_context is not None:
+            state["prospect_context"] = self.prospect_context
+        return state
+    
     async def _ensure_session_async(self):
         """Asegura que la sesión esté creada (async)"""
         if not self.session_initialized:
-            await self.session_service.create_session(
-                app_name="inbound_bant_agent",
-                user_id=self.user_id,
-                session_id=self.session_id
-            )
+            with span("session.create"):
+                await self.session_service.create_session(
+                    app_name="inbound_bant_agent",
+                    user_id=self.user_id,
+                    session_id=self.session_id,
+                    state=self._initial_state()
+                )
             self.session_initialized = True
     
     def send_message(self, message: str) -> str:
@@ -124,13 +188,14 @@ class InboundAgentSession:
                     self.session_service.create_session(
                         app_name="inbound_bant_agent",
                         user_id=self.user_id,
-                        session_id=self.session_id
+                        session_id=self.session_id,
+                        state=self._initial_state()
                     )
                 )
                 loop.close()
                 self.session_initialized = True
-            except Exception as e:
-                print(f"Error creando sesión: {e}")
+            except Exception:
+                logger.exception("session_create_failed")
         
         try:
             from google.genai import types
@@ -158,56 +223,141 @@ class InboundAgentSession:
             
             return response_text if response_text else "Lo siento, no pude procesar tu mensaje."
             
-        except Exception as e:
-            print(f"\n❌ Error en conversación: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("turn_failed")
             return f"Disculpa, tuve un problema técnico. ¿Podrías repetir eso?"
     
     async def send_message_async(self, message: str) -> str:
         """
         Envía un mensaje al agente y obtiene la respuesta (versión async para FastAPI).
         
+        El turno tiene un deadline (TURN_DEADLINE_SECONDS) y pasa por el circuit
+        breaker: si el LLM está fallando, responde en modo degradado sin llamarlo.
+        
         Args:
             message: Mensaje del prospecto
         
         Returns:
             Respuesta del agente
         """
+        self.last_tool_calls = []
+        if not llm_circuit_breaker.allow_request():
+            # Con el breaker abierto esto se repite en cada turno: se muestrea
+            logger.info("turn_degraded", breaker_state=llm_circuit_breaker.state, sampled=True)
+            return DEGRADED_REPLY
+        
         try:
-            from google.genai import types
-            
-            # Asegura que la sesión esté creada
-            await self._ensure_session_async()
-            
-            # Envía el mensaje
-            content = types.Content(
-                role='user',
-                parts=[types.Part(text=message)]
-            )
+            with span("agent.turn"):
+                response_text = await asyncio.wait_for(
+                    self._run_turn_async(message),
+                    timeout=TURN_DEADLINE_SECONDS
+                )
+            llm_circuit_breaker.record_success()
+            return response_text
             
-            # Ejecuta de forma síncrona (Runner.run es sync)
-            events = self.runner.run(
-                user_id=self.user_id,
-                session_id=self.session_id,
-                new_message=content
-            )
+        except asyncio.TimeoutError:
+            llm_circuit_breaker.record_failure()
+            logger.warning("turn_timeout", deadline_seconds=TURN_DEADLINE_SECONDS)
+            return TIMEOUT_REPLY
+        
+        except asyncio.CancelledError:
+            llm_circuit_breaker.record_abandoned()
+            raise
             
-            # Obtiene la respuesta final
-            response_text = ""
-            for event in events:
+        except Exception:
+            llm_circuit_breaker.record_failure()
+            logger.exception("turn_failed")
+            return f"Disculpa, tuve un problema técnico. ¿Podrías repetir eso?"
+    
+    async def _run_turn_async(self, message: str) -> str:
+        """Ejecuta un turno completo con el runner de ADK"""
+        from google.genai import types
+        
+        # Asegura que la sesión esté creada
+        await self._ensure_session_async()
+        
+        # Envía el mensaje
+        content = types.Content(
+            role='user',
+            parts=[types.Part(text=message)]
+        )
+        
+        # Ejecuta de forma asíncrona para no bloquear el event loop
+        # (el scheduler de app.py solo sirve si los turnos corren en paralelo)
+        events = self.runner.run_async(
+            user_id=self.user_id,
+            session_id=self.session_id,
+            new_message=content
+        )
+        
+        # Obtiene la respuesta final
+        response_text = ""
+        tool_calls = []
+        with span("runner.events"):
+            async for event in events:
                 if event.content and event.content.parts:
                     for part in event.content.parts:
+                        if part.function_call:
+                            tool_calls.append(part.function_call.name)
                         if hasattr(part, 'text') and part.text:
                             response_text = part.text
-            
-            return response_text if response_text else "Lo siento, no pude procesar tu mensaje."
-            
-        except Exception as e:
-            print(f"\n❌ Error en conversación: {e}")
-            import traceback
-            traceback.print_exc()
-            return f"Disculpa, tuve un problema técnico. ¿Podrías repetir eso?"
+        self.last_tool_calls = tool_calls
+        
+        return response_text if response_text else "Lo siento, no pude procesar tu mensaje."
+    
+    async def to_snapshot(self) -> dict:
+        """
+        Serializa la sesión (estado BANT + historial ADK) a un dict JSON-compatible.
+        Lo usa el tier frío de session_store para liberar los objetos vivos.
+        """
+        adk_session = None
+        if self.session_initialized:
+            adk_session = await self.session_service.get_session(
+                app_name="inbound_bant_agent",
+                user_id=self.user_id,
+                session_id=self.session_id
+            )
+        
+        return {
+            "tenant_id": self.tenant_id,
+            "prospect_phone": self.prospect_phone,
+            "bant_data": self.bant_data,
+            "qualified": self.qualified,
+            "meeting_scheduled": self.meeting_scheduled,
+            "prospect_context": self.prospect_context,
+            "adk_session": adk_session.model_dump(mode="json") if adk_session else None
+        }
+    
+    @classmethod
+    async def from_snapshot(cls, snapshot: dict) -> "InboundAgentSession":
+        """
+        Reconstruye una sesión desde to_snapshot().
+        El historial se reinserta evento por evento en un InMemorySessionService nuevo.
+        """
+        from google.adk.sessions import Session
+        
+        session = cls(
+            tenant_id=snapshot["tenant_id"],
+            prospect_phone=snapshot["prospect_phone"]
+        )
+        session.bant_data = snapshot["bant_data"]
+        session.qualified = snapshot["qualified"]
+        session.meeting_scheduled = snapshot["meeting_scheduled"]
+        session.prospect_context = snapshot.get("prospect_context")
+        
+        if snapshot["adk_session"]:
+            stored = Session.model_validate(snapshot["adk_session"])
+            adk_session = await session.session_service.create_session(
+                app_name="inbound_bant_agent",
+                user_id=session.user_id,
+                session_id=session.session_id,
+                state=stored.state
+            )
+            for event in stored.events:
+                await session.session_service.append_event(adk_session, event)
+            session.session_initialized = True
+        
+        return session
     
     def is_qualified(self) -> bool:
         """Verifica si el prospecto está calificado según BANT"""
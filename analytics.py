@@ -0,0 +1,290 @@
+"""
+Analítica del funnel de calificación (prospectos → reuniones).
+Los agregados se mantienen de forma incremental cada vez que save_to_crm o
+schedule_meeting confirman un registro, así las consultas del dashboard son
+O(1) u O(días) en vez de recorrer todo el CRM y el calendario.
+
+Uso:
+    python analytics.py rebuild            # Recalcula desde los JSON mock
+    python analytics.py summary [tenant]   # Muestra el resumen del funnel
+"""
+import json
+import sys
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools.crm_tools import _load_mock_db
+from tools.calendar_tools import _load_mock_calendar
+
+
+BANT_FIELDS = ("budget", "authority", "need", "timeline")
+
+
+def _record_number(record_id: str) -> int:
+    """Extrae el correlativo de ids tipo 'prospect_12' o 'meeting_3'"""
+    try:
+        return int(record_id.rsplit("_", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return 0
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class _DayAggregate:
+    """Contadores de un día para un tenant"""
+
+    __slots__ = ("prospects", "by_status", "meetings")
+
+    def __init__(self):
+        self.prospects = 0
+        self.by_status: Counter = Counter()
+        self.meetings = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "prospects": self.prospects,
+            "by_qualification_status": dict(self.by_status),
+            "meetings": self.meetings
+        }
+
+
+class _TenantAggregate:
+    """Contadores acumulados de un tenant"""
+
+    def __init__(self):
+        self.prospects = 0
+        self.by_status: Counter = Counter()
+        self.bant_captured: Counter = Counter()
+        self.meetings = 0
+        self.time_to_meeting_total = 0.0
+        self.time_to_meeting_count = 0
+        self.days: Dict[str, _DayAggregate] = defaultdict(_DayAggregate)
+
+    def to_dict(self) -> Dict[str, Any]:
+        qualified = self.by_status.get("QUALIFIED", 0)
+        avg_hours = (
+            self.time_to_meeting_total / self.time_to_meeting_count / 3600
+            if self.time_to_meeting_count else None
+        )
+        return {
+            "prospects": self.prospects,
+            "by_qualification_status": dict(self.by_status),
+            "qualification_rate": round(qualified / self.prospects, 4) if self.prospects else 0.0,
+            "bant_captured": {field: self.bant_captured.get(field, 0) for field in BANT_FIELDS},
+            "meetings": self.meetings,
+            "meeting_rate": round(self.meetings / self.prospects, 4) if self.prospects else 0.0,
+            "avg_hours_to_meeting": round(avg_hours, 2) if avg_hours is not None else None,
+            "days_with_activity": len(self.days)
+        }
+
+
+class _Aggregates:
+    """Agregados de todos los tenants y el último correlativo aplicado"""
+
+    def __init__(self):
+        self.tenants: Dict[str, _TenantAggregate] = defaultdict(_TenantAggregate)
+        # Primer registro en CRM por (tenant, teléfono) sin reunión todavía,
+        # para calcular el tiempo hasta la primera reunión
+        self.first_seen: Dict[str, float] = {}
+        self.last_prospect = 0
+        self.last_meeting = 0
+
+    def apply_prospect(self, prospect: Dict[str, Any]):
+        number = _record_number(prospect.get("id"))
+        if number and number <= self.last_prospect:
+            return
+        self.last_prospect = max(self.last_prospect, number)
+
+        tenant_id = prospect.get("tenant_id") or "default"
+        status = prospect.get("qualification_status") or "UNKNOWN"
+        created_at = prospect.get("created_at") or ""
+
+        tenant = self.tenants[tenant_id]
+        tenant.prospects += 1
+        tenant.by_status[status] += 1
+        bant = prospect.get("bant") or {}
+        for field in BANT_FIELDS:
+            if bant.get(field):
+                tenant.bant_captured[field] += 1
+
+        day = tenant.days[created_at[:10] or "unknown"]
+        day.prospects += 1
+        day.by_status[status] += 1
+
+        created_ts = _parse_timestamp(created_at)
+        key = f"{tenant_id}|{prospect.get('phone')}"
+        if created_ts is not None and key not in self.first_seen:
+            self.first_seen[key] = created_ts
+
+    def apply_meeting(self, meeting: Dict[str, Any]):
+        number = _record_number(meeting.get("id"))
+        if number and number <= self.last_meeting:
+            return
+        self.last_meeting = max(self.last_meeting, number)
+
+        tenant_id = meeting.get("tenant_id") or "default"
+        created_at = meeting.get("created_at") or ""
+
+        tenant = self.tenants[tenant_id]
+        tenant.meetings += 1
+        tenant.days[created_at[:10] or "unknown"].meetings += 1
+
+        # Tiempo desde el registro en CRM hasta el inicio de la primera reunión
+        first_seen = self.first_seen.pop(f"{tenant_id}|{meeting.get('prospect_phone')}", None)
+        starts_at = _parse_timestamp(f"{meeting.get('date')}T{meeting.get('time')}")
+        if first_seen is not None and starts_at is not None and starts_at >= first_seen:
+            tenant.time_to_meeting_total += starts_at - first_seen
+            tenant.time_to_meeting_count += 1
+
+    def apply(self, kind: str, record: Dict[str, Any]):
+        if kind == "prospect":
+            self.apply_prospect(record)
+        else:
+            self.apply_meeting(record)
+
+
+class FunnelAnalytics:
+    """
+    Agregados del funnel por tenant, por día, por qualification_status y por
+    campo BANT.
+
+    Se construyen una vez por proceso desde los JSON mock (la primera vez que
+    se consultan) y luego se actualizan con record_prospect/record_meeting.
+    Los ids del mock son correlativos y las tools los registran en orden
+    (save_to_crm y schedule_meeting guardan y registran bajo un lock), así que
+    un registro ya contado en el rebuild no se cuenta dos veces.
+
+    El rebuild lee y agrega los JSON sin tomar `_lock`: las tools de ADK
+    corren en el event loop y record_prospect/record_meeting no pueden
+    esperar a que termine. Lo que se registra mientras tanto queda en
+    `_pending` y se re-aplica al reemplazar los agregados.
+    """
+
+    def __init__(self):
+        # Protege _state y _pending (secciones cortas)
+        self._lock = threading.Lock()
+        # Serializa los rebuilds entre sí
+        self._rebuild_lock = threading.Lock()
+        self._state = _Aggregates()
+        self._pending: Optional[List[Tuple[str, Dict[str, Any]]]] = None
+        self._loaded = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def ensure_loaded(self):
+        """Construye los agregados si todavía no se cargaron"""
+        if not self._loaded:
+            with self._rebuild_lock:
+                # Otro hilo pudo terminar el rebuild mientras se esperaba el lock
+                if not self._loaded:
+                    self._rebuild()
+
+    def rebuild(self) -> Dict[str, int]:
+        """Recalcula todos los agregados leyendo el CRM y el calendario completos"""
+        with self._rebuild_lock:
+            return self._rebuild()
+
+    def _rebuild(self) -> Dict[str, int]:
+        # Desde acá cada registro confirmado también queda en _pending: si el
+        # JSON ya lo traía, el correlativo lo descarta al re-aplicarlo
+        with self._lock:
+            self._pending = []
+        try:
+            prospects = _load_mock_db()["prospects"]
+            meetings = _load_mock_calendar()["meetings"]
+            state = _Aggregates()
+            for prospect in prospects:
+                state.apply_prospect(prospect)
+            for meeting in meetings:
+                state.apply_meeting(meeting)
+
+            with self._lock:
+                for kind, record in self._pending:
+                    state.apply(kind, record)
+                self._state = state
+                self._loaded = True
+        finally:
+            with self._lock:
+                self._pending = None
+        return {"prospects": len(prospects), "meetings": len(meetings)}
+
+    def record_prospect(self, prospect: Dict[str, Any]):
+        """Suma un prospecto recién guardado en el CRM"""
+        self._record("prospect", prospect)
+
+    def record_meeting(self, meeting: Dict[str, Any]):
+        """Suma una reunión recién agendada"""
+        self._record("meeting", meeting)
+
+    def _record(self, kind: str, record: Dict[str, Any]):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((kind, record))
+            if self._loaded:
+                self._state.apply(kind, record)
+
+    def summary(self, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+        """Resumen del funnel por tenant (o de un tenant específico)"""
+        self.ensure_loaded()
+        with self._lock:
+            tenants = self._state.tenants
+            if tenant_id is not None:
+                tenant = tenants.get(tenant_id)
+                return tenant.to_dict() if tenant else {}
+            return {tid: tenant.to_dict() for tid, tenant in tenants.items()}
+
+    def daily(
+        self,
+        tenant_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Serie diaria de un tenant.
+
+        Args:
+            tenant_id: ID del tenant
+            start: Fecha inicial YYYY-MM-DD (inclusive)
+            end: Fecha final YYYY-MM-DD (inclusive)
+
+        Returns:
+            Dict fecha → contadores del día, ordenado por fecha
+        """
+        self.ensure_loaded()
+        with self._lock:
+            tenant = self._state.tenants.get(tenant_id)
+            if tenant is None:
+                return {}
+            return {
+                day: aggregate.to_dict()
+                for day, aggregate in sorted(tenant.days.items())
+                if (start is None or day >= start) and (end is None or day <= end)
+            }
+
+
+# Instancia compartida por las tools y la API
+funnel_analytics = FunnelAnalytics()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "summary"
+
+    if command == "rebuild":
+        counts = funnel_analytics.rebuild()
+        print(f"✅ Agregados recalculados: {counts['prospects']} prospectos, {counts['meetings']} reuniones")
+        print(json.dumps(funnel_analytics.summary(), indent=2, ensure_ascii=False))
+    elif command == "summary":
+        tenant = sys.argv[2] if len(sys.argv) > 2 else None
+        print(json.dumps(funnel_analytics.summary(tenant), indent=2, ensure_ascii=False))
+    else:
+        print(f"Comando desconocido: {command}. Usa 'rebuild' o 'summary'.")
+        sys.exit(1)
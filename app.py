@@ -3,31 +3,79 @@ FastAPI app para recibir webhooks de WhatsApp (vía Spicy).
 Maneja las conversaciones con el agente inbound.
 """
 import os
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from structured_logging import (
+    get_logger, log_context, logging_metrics, setup_logging, shutdown_logging
+)
+
+# Logs JSON por una cola: el request no espera la escritura
+setup_logging()
+logger = get_logger(__name__)
+
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
-from agent import InboundAgentSession
+from agent import InboundAgentSession, hedging_policy, llm_circuit_breaker
+from analytics import funnel_analytics
+from export import InvalidCursor, export_records
+from profiling import profiler, span
+from prospect_context import prefetch_prospect_context
+from scheduler import FALLBACK_REPLY, SchedulerOverloaded, TenantScheduler
+from session_store import SessionStore
+from transcripts import transcripts
+
+
+# Almacenamiento temporal de sesiones
+# En producción, esto debería ser Redis o similar.
+# Las sesiones inactivas se comprimen en memoria y se rehidratan al volver a escribir.
+active_sessions = SessionStore(
+    restore=InboundAgentSession.from_snapshot,
+    idle_seconds=float(os.getenv("SESSION_IDLE_SECONDS", "900"))
+)
+
+# Prospectos distintos procesados en paralelo dentro de un lote
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+# Control de admisión para la cuota compartida de Gemini
+scheduler = TenantScheduler(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranca el loop que congela sesiones inactivas"""
+    setup_logging()
+    # Carga el índice de transcripciones antes del primer mensaje
+    if transcripts.enabled:
+        await asyncio.to_thread(transcripts.open)
+    sweeper = asyncio.create_task(
+        active_sessions.run_sweeper(float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60")))
+    )
+    yield
+    sweeper.cancel()
+    transcripts.close()
+    shutdown_logging()
+
 
 app = FastAPI(
     title="Inbound BANT Agent API",
     description="API para agente inbound que califica prospectos usando BANT",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
-# Almacenamiento temporal de sesiones
-# En producción, esto debería ser Redis o similar
-active_sessions: Dict[str, InboundAgentSession] = {}
-
-
 class WhatsAppMessage(BaseModel):
     """Modelo para mensajes entrantes de WhatsApp"""
     phone: str = Field(..., description="Número de teléfono del remitente")
@@ -45,6 +93,35 @@ class AgentResponse(BaseModel):
     meeting_scheduled: bool = False
 
 
+class ProfilingRequest(BaseModel):
+    """Arma el profiling de los próximos requests del webhook"""
+    requests: int = Field(..., ge=0, le=1000, description="Cantidad de requests a perfilar (0 desarma)")
+    tenant_id: Optional[str] = Field(default=None, description="Solo requests de este tenant")
+
+
+class BatchWhatsAppRequest(BaseModel):
+    """Lote de mensajes agrupados por el gateway de WhatsApp"""
+    messages: List[WhatsAppMessage] = Field(
+        ...,
+        min_length=1,
+        max_length=500,
+        description="Mensajes en el orden en que llegaron"
+    )
+
+
+class BatchItemResult(BaseModel):
+    """Resultado de un mensaje dentro del lote"""
+    index: int = Field(..., description="Posición del mensaje en el lote")
+    success: bool
+    result: Optional[AgentResponse] = None
+    error: Optional[str] = None
+
+
+class BatchAgentResponse(BaseModel):
+    """Resultados del lote, en el mismo orden que los mensajes"""
+    results: List[BatchItemResult]
+
+
 @app.get("/")
 async def root():
     """Endpoint raíz para health check"""
@@ -67,7 +144,10 @@ async def health_check():
 
 
 @app.post("/webhook/whatsapp", response_model=AgentResponse)
-async def whatsapp_webhook(message: WhatsAppMessage):
+async def whatsapp_webhook(
+    message: WhatsAppMessage,
+    x_profile: Optional[str] = Header(default=None)
+):
     """
     Webhook que recibe mensajes de WhatsApp desde Spicy.
     
@@ -76,45 +156,168 @@ async def whatsapp_webhook(message: WhatsAppMessage):
     2. Crea o recupera la sesión del agente
     3. Procesa el mensaje con el agente
     4. Retorna la respuesta para enviar al prospecto
+    
+    Con el header X-Profile: <PROFILING_TOKEN> (o por muestreo / /admin/profiling)
+    el request se perfila y el resultado queda en data/profiles/.
     """
     try:
-        phone = message.phone
-        session_id = f"{message.tenant_id}_{phone}"
+        reason = profiler.reason_for(x_profile, message.tenant_id)
+        if reason is None:
+            return await _process_message(message)
         
-        # Obtiene o crea sesión del agente para este prospecto
-        if session_id not in active_sessions:
-            print(f"🆕 Creando nueva sesión para {phone}")
-            active_sessions[session_id] = InboundAgentSession(
+        with profiler.capture(
+            reason,
+            tenant_id=message.tenant_id,
+            session_id=f"{message.tenant_id}_{message.phone}"
+        ):
+            return await _process_message(message)
+        
+    except Exception as e:
+        logger.exception(
+            "message_failed",
+            tenant_id=message.tenant_id,
+            session_id=f"{message.tenant_id}_{message.phone}"
+        )
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error procesando mensaje: {str(e)}"
+        )
+
+
+async def _process_message(message: WhatsAppMessage) -> AgentResponse:
+    """Procesa un mensaje con la sesión del prospecto y arma la respuesta"""
+    phone = message.phone
+    session_id = f"{message.tenant_id}_{phone}"
+    start = time.perf_counter()
+    
+    def create_session() -> InboundAgentSession:
+        logger.info("session_created")
+        with span("session.build"):
+            return InboundAgentSession(
                 tenant_id=message.tenant_id,
                 prospect_phone=phone
             )
+    
+    # Obtiene (rehidrata) o crea sesión del agente para este prospecto
+    with log_context(tenant_id=message.tenant_id, session_id=session_id):
+        # Sesión nueva: busca al prospecto en el CRM mientras se arma la sesión
+        prefetch = None
+        if session_id not in active_sessions:
+            prefetch = prefetch_prospect_context(phone, message.tenant_id)
         
-        session = active_sessions[session_id]
-        
-        # Procesa el mensaje con el agente (versión async)
-        print(f"📨 Mensaje de {phone}: {message.message}")
-        agent_response = await session.send_message_async(message.message)
-        print(f"🤖 Respuesta: {agent_response[:100]}...")
-        
-        # Obtiene el estado de calificación
-        status = session.get_qualification_status()
+        async with active_sessions.checkout(session_id, create_session) as session:
+            if prefetch is not None and not session.session_initialized and session.prospect_context is None:
+                session.prospect_context = await prefetch
+            
+            # Procesa el mensaje con el agente (versión async) pasando por el scheduler.
+            # Los prospectos con conversación en curso tienen prioridad en la cola.
+            logger.info("message_received", phone=phone, message=message.message, sampled=True)
+            try:
+                with span("scheduler.run"):
+                    agent_response = await scheduler.run(
+                        message.tenant_id,
+                        lambda: session.send_message_async(message.message),
+                        priority=session.session_initialized
+                    )
+            except SchedulerOverloaded as e:
+                logger.warning("turn_shed", reason=e.reason)
+                agent_response = FALLBACK_REPLY
+            
+            # Obtiene el estado de calificación
+            status = session.get_qualification_status()
+            latency_ms = round((time.perf_counter() - start) * 1000, 1)
+            
+            # Guarda el turno en el archivo de transcripciones (auditoría).
+            # La escritura (y el fsync opcional) va en un hilo; dentro del
+            # checkout para que los turnos de un prospecto queden en orden.
+            if transcripts.enabled:
+                try:
+                    await asyncio.to_thread(
+                        transcripts.append,
+                        message.tenant_id, phone, session_id, message.message, agent_response,
+                        tool_calls=session.last_tool_calls, latency_ms=latency_ms
+                    )
+                except Exception:
+                    logger.exception("transcript_append_failed")
         
-        return AgentResponse(
-            phone=phone,
+        logger.info(
+            "reply_sent",
             response=agent_response,
-            session_id=session_id,
+            latency_ms=latency_ms,
+            tool_calls=session.last_tool_calls,
             qualified=status["is_qualified"],
-            meeting_scheduled=status["meeting_scheduled"]
+            meeting_scheduled=status["meeting_scheduled"],
+            sampled=True
         )
+    
+    return AgentResponse(
+        phone=phone,
+        response=agent_response,
+        session_id=session_id,
+        qualified=status["is_qualified"],
+        meeting_scheduled=status["meeting_scheduled"]
+    )
+
+
+async def _process_batch(messages: List[WhatsAppMessage]):
+    """
+    Procesa un lote agrupando por sesión.
+    Los mensajes de un mismo prospecto se procesan en orden; prospectos
+    distintos corren en paralelo hasta BATCH_MAX_CONCURRENCY.
+    Genera los BatchItemResult a medida que terminan.
+    """
+    groups: Dict[str, List[tuple]] = {}
+    for index, message in enumerate(messages):
+        groups.setdefault(f"{message.tenant_id}_{message.phone}", []).append((index, message))
+    
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    results: asyncio.Queue = asyncio.Queue()
+    
+    async def run_group(items: List[tuple]):
+        async with semaphore:
+            for index, message in items:
+                try:
+                    result = await _process_message(message)
+                    await results.put(BatchItemResult(index=index, success=True, result=result))
+                except Exception as e:
+                    logger.exception(
+                        "batch_message_failed",
+                        index=index,
+                        tenant_id=message.tenant_id,
+                        session_id=f"{message.tenant_id}_{message.phone}"
+                    )
+                    await results.put(BatchItemResult(index=index, success=False, error=str(e)))
+    
+    tasks = [asyncio.create_task(run_group(items)) for items in groups.values()]
+    try:
+        for _ in range(len(messages)):
+            yield await results.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/webhook/whatsapp/batch", response_model=BatchAgentResponse)
+async def whatsapp_webhook_batch(batch: BatchWhatsAppRequest, stream: bool = False):
+    """
+    Webhook para lotes de mensajes de WhatsApp.
+    
+    Con stream=true responde NDJSON con un resultado por línea a medida que
+    cada mensaje termina (el campo index indica a qué mensaje corresponde).
+    Sin stream, retorna todos los resultados en el orden del lote.
+    """
+    if stream:
+        async def ndjson():
+            async for item in _process_batch(batch.messages):
+                yield item.model_dump_json() + "\n"
         
-    except Exception as e:
-        print(f"❌ Error procesando mensaje: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error procesando mensaje: {str(e)}"
-        )
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+    
+    results: List[Optional[BatchItemResult]] = [None] * len(batch.messages)
+    async for item in _process_batch(batch.messages):
+        results[item.index] = item
+    
+    return BatchAgentResponse(results=results)
 
 
 @app.post("/session/close/{session_id}")
@@ -123,8 +326,7 @@ async def close_session(session_id: str):
     Cierra una sesión activa.
     Útil para liberar recursos.
     """
-    if session_id in active_sessions:
-        del active_sessions[session_id]
+    if active_sessions.remove(session_id):
         return {"message": f"Sesión {session_id} cerrada exitosamente"}
     
     raise HTTPException(status_code=404, detail="Sesión no encontrada")
@@ -135,11 +337,11 @@ async def get_session_status(session_id: str):
     """
     Obtiene el estado de calificación de una sesión.
     """
-    if session_id not in active_sessions:
+    status = active_sessions.get_status(session_id)
+    if status is None:
         raise HTTPException(status_code=404, detail="Sesión no encontrada")
     
-    session = active_sessions[session_id]
-    return session.get_qualification_status()
+    return status
 
 
 @app.get("/sessions")
@@ -147,24 +349,229 @@ async def list_sessions():
     """Lista todas las sesiones activas"""
     return {
         "active_sessions": len(active_sessions),
-        "sessions": [
-            {
-                "session_id": sid,
-                "status": session.get_qualification_status()
-            }
-            for sid, session in active_sessions.items()
-        ]
+        "sessions": active_sessions.list_statuses()
     }
 
 
+@app.get("/metrics/sessions")
+async def session_memory_metrics():
+    """Memoria del tier frío de sesiones y latencia de rehidratación"""
+    return active_sessions.memory_report()
+
+
+@app.get("/transcripts/{tenant_id}/{phone}")
+async def get_transcript(
+    tenant_id: str,
+    phone: str,
+    limit: int = 50,
+    before: Optional[int] = None,
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Historial archivado de un prospecto (también de sesiones ya cerradas).
+    Trae los mensajes completos: requiere el token admin (PROFILING_TOKEN).
+    
+    - limit: turnos por página (los más recientes primero en paginar)
+    - before: `next_before` de la página anterior, para ver turnos más antiguos
+    """
+    if not profiler.check_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token inválido")
+    if not transcripts.enabled:
+        raise HTTPException(status_code=404, detail="Archivo de transcripciones deshabilitado")
+    history = await asyncio.to_thread(
+        transcripts.history, tenant_id, phone, limit=min(max(limit, 1), 500), before=before
+    )
+    if not history["total"]:
+        raise HTTPException(status_code=404, detail="Prospecto sin transcripciones")
+    return history
+
+
+@app.delete("/transcripts/{tenant_id}/{phone}")
+async def erase_transcript(
+    tenant_id: str,
+    phone: str,
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Borra el historial archivado de un prospecto (deja de servirse de inmediato;
+    el espacio se libera en la próxima compactación). Requiere token admin.
+    """
+    if not profiler.check_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token inválido")
+    if not transcripts.enabled:
+        raise HTTPException(status_code=404, detail="Archivo de transcripciones deshabilitado")
+    erased = await asyncio.to_thread(transcripts.erase, tenant_id, phone)
+    if not erased:
+        raise HTTPException(status_code=404, detail="Prospecto sin transcripciones")
+    return {"erased": erased}
+
+
+@app.post("/admin/transcripts/compact")
+async def compact_transcripts(
+    keep_days: Optional[float] = None,
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Reescribe los segmentos sin los turnos borrados (y, con keep_days, sin los
+    más antiguos). Los turnos nuevos esperan a que termine. Requiere token admin.
+    """
+    if not profiler.check_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token inválido")
+    if not transcripts.enabled:
+        raise HTTPException(status_code=404, detail="Archivo de transcripciones deshabilitado")
+    return await asyncio.to_thread(transcripts.compact, keep_days)
+
+
+@app.get("/metrics/transcripts")
+async def transcript_metrics():
+    """Tamaño del archivo de transcripciones e índice"""
+    if not transcripts.enabled:
+        return {"enabled": False}
+    return await asyncio.to_thread(transcripts.stats)
+
+
+@app.get("/export/{kind}")
+async def export_data(
+    kind: str,
+    format: str = "ndjson",
+    tenant_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    status: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Exporta prospectos o reuniones en streaming (NDJSON o CSV).
+    Trae nombre, teléfono y email: requiere el token admin (PROFILING_TOKEN).
+    
+    - kind: "prospects" o "meetings"
+    - start/end: fechas YYYY-MM-DD (registro del prospecto o fecha de la reunión)
+    - status: qualification_status (prospectos) o status (reuniones)
+    - cursor: `_cursor` del último registro recibido, para retomar
+    """
+    if not profiler.check_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token inválido")
+    if kind not in ("prospects", "meetings"):
+        raise HTTPException(status_code=404, detail="Export no encontrado")
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Formato debe ser ndjson o csv")
+    
+    try:
+        lines = export_records(kind, format, tenant_id, start, end, status, cursor, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        lines,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'}
+    )
+
+
+@app.get("/metrics/llm")
+async def llm_metrics():
+    """Estado del circuit breaker y métricas de hedging del LLM"""
+    return {
+        "circuit_breaker": llm_circuit_breaker.metrics(),
+        "hedging": hedging_policy.metrics()
+    }
+
+
+@app.get("/metrics/logging")
+async def log_pipeline_metrics():
+    """Cola de logs: registros pendientes y descartados"""
+    return logging_metrics()
+
+
+@app.get("/metrics/scheduler")
+async def scheduler_metrics():
+    """Métricas de colas del scheduler LLM para todos los tenants"""
+    return scheduler.metrics()
+
+
+@app.get("/metrics/scheduler/{tenant_id}")
+async def tenant_scheduler_metrics(tenant_id: str):
+    """Métricas de colas del scheduler LLM para un tenant"""
+    metrics = scheduler.metrics(tenant_id)
+    if not metrics:
+        raise HTTPException(status_code=404, detail="Tenant sin actividad")
+    return metrics
+
+
+@app.get("/admin/profiling")
+async def profiling_status(x_admin_token: Optional[str] = Header(default=None)):
+    """Estado del profiling y resumen de los perfiles guardados"""
+    if not profiler.check_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token inválido")
+    return {**profiler.status(), "profiles": profiler.list_profiles()}
+
+
+@app.post("/admin/profiling")
+async def arm_profiling(
+    request: ProfilingRequest,
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """Perfila los próximos N requests del webhook (opcionalmente de un tenant)"""
+    if not profiler.check_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token inválido")
+    profiler.arm(request.requests, request.tenant_id)
+    return profiler.status()
+
+
+@app.get("/admin/profiling/{profile_id}")
+async def get_profile(profile_id: str, x_admin_token: Optional[str] = Header(default=None)):
+    """Timeline completo de un perfil"""
+    if not profiler.check_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token inválido")
+    profile = profiler.load(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return profile
+
+
+@app.get("/analytics/funnel")
+async def analytics_funnel(tenant_id: Optional[str] = None):
+    """
+    Resumen del funnel (prospectos, calificación, BANT, reuniones).
+    Sin tenant_id retorna todos los tenants.
+    """
+    # La primera consulta recorre los JSON completos: fuera del event loop
+    if not funnel_analytics.loaded:
+        await asyncio.to_thread(funnel_analytics.ensure_loaded)
+    summary = funnel_analytics.summary(tenant_id)
+    if tenant_id is not None and not summary:
+        raise HTTPException(status_code=404, detail="Tenant sin datos")
+    return summary
+
+
+@app.get("/analytics/funnel/{tenant_id}/daily")
+async def analytics_daily(tenant_id: str, start: Optional[str] = None, end: Optional[str] = None):
+    """Serie diaria del funnel de un tenant (fechas YYYY-MM-DD, inclusive)"""
+    if not funnel_analytics.loaded:
+        await asyncio.to_thread(funnel_analytics.ensure_loaded)
+    return funnel_analytics.daily(tenant_id, start, end)
+
+
+@app.post("/analytics/rebuild")
+async def analytics_rebuild(x_admin_token: Optional[str] = Header(default=None)):
+    """Recalcula los agregados desde cero leyendo el CRM y el calendario (requiere token admin)"""
+    if not profiler.check_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token inválido")
+    counts = await asyncio.to_thread(funnel_analytics.rebuild)
+    return {"message": "Agregados recalculados", **counts}
+
+
 # Endpoint para testing local (sin necesidad de WhatsApp real)
 @app.post("/test/chat")
-async def test_chat(message: WhatsAppMessage):
+async def test_chat(message: WhatsAppMessage, x_profile: Optional[str] = Header(default=None)):
     """
     Endpoint de prueba para simular conversaciones.
     Útil para desarrollo local.
     """
-    return await whatsapp_webhook(message)
+    return await whatsapp_webhook(message, x_profile)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,713 @@
+"""
+Benchmarks de rendimiento del agente inbound.
+Corren sin API key y sin tocar los datos reales de data/.
+
+Uso:
+    python bench.py analytics [--prospects 1000000]
+    python bench.py sessions [--sessions 200] [--turns 20]
+    python bench.py batch [--prospects 50] [--messages 4] [--latency-ms 200]
+    python bench.py resilience [--turns 300]
+    python bench.py profiling [--turns 200]
+    python bench.py logging [--turns 20000]
+    python bench.py scheduling [--latency-ms 400]
+    python bench.py prefetch [--prospects 20000] [--latency-ms 400]
+    python bench.py transcripts [--turns 1000000] [--prospects 50000]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+# Los benchmarks del webhook no escriben en data/transcripts
+os.environ.setdefault("TRANSCRIPTS_ENABLED", "false")
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_analytics(num_prospects: int):
+    """Compara consultas del funnel incrementales vs escanear el CRM completo"""
+    from analytics import FunnelAnalytics
+    from tools import calendar_tools, crm_tools
+
+    rng = random.Random(42)
+    tenants = [f"tenant_{i:02d}" for i in range(20)]
+    statuses = ["QUALIFIED", "NOT_QUALIFIED"]
+    base = datetime(2025, 1, 1)
+
+    def prospect(i: int) -> dict:
+        return {
+            "id": f"prospect_{i}",
+            "tenant_id": rng.choice(tenants),
+            "name": f"Prospecto {i}",
+            "phone": f"+569{i:08d}",
+            "email": f"p{i}@empresa.com",
+            "bant": {
+                "budget": "20000 USD" if rng.random() < 0.7 else "",
+                "authority": "CEO" if rng.random() < 0.8 else "",
+                "need": "CRM",
+                "timeline": "60 días" if rng.random() < 0.6 else ""
+            },
+            "qualification_status": rng.choice(statuses),
+            "notes": "",
+            "created_at": (base + timedelta(minutes=i % 500_000)).isoformat(),
+            "source": "whatsapp_inbound"
+        }
+
+    num_meetings = num_prospects // 10
+    with tempfile.TemporaryDirectory() as tmp:
+        crm_tools.MOCK_DB_FILE = Path(tmp) / "crm_mock.json"
+        calendar_tools.MOCK_CALENDAR_FILE = Path(tmp) / "calendar_mock.json"
+
+        print(f"Generando {num_prospects:,} prospectos y {num_meetings:,} reuniones...")
+        prospects = [prospect(i) for i in range(1, num_prospects + 1)]
+        meetings = [
+            {
+                "id": f"meeting_{i}",
+                "tenant_id": p["tenant_id"],
+                "prospect_phone": p["phone"],
+                "date": p["created_at"][:10],
+                "time": "16:00",
+                "created_at": p["created_at"]
+            }
+            for i, p in enumerate(prospects[::10], start=1)
+        ]
+        crm_tools.MOCK_DB_FILE.write_text(json.dumps({"prospects": prospects}))
+        calendar_tools.MOCK_CALENDAR_FILE.write_text(json.dumps({"meetings": meetings}))
+        del prospects, meetings
+
+        analytics = FunnelAnalytics()
+        _, rebuild_s = _timed(analytics.rebuild)
+
+        tenant = tenants[0]
+        runs = 1000
+        _, summary_s = _timed(lambda: [analytics.summary(tenant) for _ in range(runs)])
+        _, daily_s = _timed(lambda: [analytics.daily(tenant, "2025-03-01", "2025-03-31") for _ in range(100)])
+
+        new_prospects = [prospect(num_prospects + i) for i in range(1, runs + 1)]
+        _, record_s = _timed(lambda: [analytics.record_prospect(p) for p in new_prospects])
+
+        # Un registro que llega durante un rebuild no espera a que termine
+        rebuild = threading.Thread(target=analytics.rebuild)
+        rebuild.start()
+        time.sleep(0.2)
+        _, record_during_rebuild_s = _timed(
+            lambda: analytics.record_prospect(prospect(num_prospects + runs + 1))
+        )
+        rebuild.join()
+
+        def scan():
+            db = crm_tools._load_mock_db()
+            rows = [p for p in db["prospects"] if p.get("tenant_id") == tenant]
+            qualified = sum(1 for p in rows if p["qualification_status"] == "QUALIFIED")
+            return qualified / len(rows)
+
+        _, scan_s = _timed(scan)
+
+    print(f"Rebuild desde cero:            {rebuild_s:8.2f} s")
+    print(f"Resumen de tenant (agregado):  {summary_s / runs * 1e6:8.1f} µs/consulta")
+    print(f"Serie diaria de 31 días:       {daily_s / 100 * 1e3:8.2f} ms/consulta")
+    print(f"Actualización incremental:     {record_s / runs * 1e6:8.1f} µs/registro")
+    print(f"Registro durante un rebuild:   {record_during_rebuild_s * 1e6:8.1f} µs")
+    print(f"Escaneo completo del CRM:      {scan_s:8.2f} s/consulta")
+
+
+def bench_sessions(num_sessions: int, turns: int):
+    """Memoria por sesión inactiva (caliente vs comprimida) y latencia de rehidratación"""
+    # Solo se construyen agentes y sesiones, no hay llamadas al LLM
+    os.environ.setdefault("GOOGLE_API_KEY", "bench")
+    from google.adk.events import Event
+    from google.genai import types
+    from agent import InboundAgentSession
+    from session_store import SessionStore
+
+    async def build_session(i: int) -> InboundAgentSession:
+        session = InboundAgentSession(tenant_id="bench", prospect_phone=f"+569{i:08d}")
+        await session._ensure_session_async()
+        adk_session = await session.session_service.get_session(
+            app_name="inbound_bant_agent", user_id=session.user_id, session_id=session.session_id
+        )
+        for turn in range(turns):
+            for author, role, text in (
+                ("user", "user", f"Mensaje {turn} del prospecto: necesitamos un CRM para el equipo de ventas"),
+                ("inbound_bant_agent", "model", f"Respuesta {turn}: ¡Genial! Cuéntame un poco más sobre tu equipo 😊")
+            ):
+                event = Event(
+                    invocation_id=f"inv_{turn}",
+                    author=author,
+                    content=types.Content(role=role, parts=[types.Part(text=text)])
+                )
+                await session.session_service.append_event(adk_session, event)
+        return session
+
+    async def run():
+        store = SessionStore(restore=InboundAgentSession.from_snapshot, idle_seconds=0)
+        # Calienta imports y cachés de ADK fuera de la medición
+        await (await build_session(-1)).to_snapshot()
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(num_sessions):
+            store.put(f"bench_{i}", await build_session(i))
+        hot_bytes = tracemalloc.get_traced_memory()[0] - before
+
+        frozen = await store.freeze_idle()
+        gc.collect()
+        cold_bytes = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        cold_report = store.memory_report()
+        for i in range(num_sessions):
+            await store.get(f"bench_{i}")
+        report = store.memory_report()
+
+        print(f"Sesiones: {num_sessions} con {turns} turnos cada una ({frozen} congeladas)")
+        print(f"Memoria por sesión caliente:   {hot_bytes / num_sessions / 1024:8.1f} KB")
+        print(f"Memoria por sesión fría:       {cold_bytes / num_sessions / 1024:8.1f} KB")
+        print(f"Blob comprimido por sesión:    {cold_report['cold_bytes_per_session'] / 1024:8.1f} KB"
+              f"  (ratio {cold_report['compression_ratio']}x)")
+        print(f"Rehidratación p50 / p99:       {report['rehydrate_ms_p50']} / {report['rehydrate_ms_p99']} ms")
+
+    asyncio.run(run())
+
+
+def bench_batch(num_prospects: int, messages_per_prospect: int, latency_ms: float):
+    """
+    Un request HTTP por mensaje vs /webhook/whatsapp/batch con el LLM stub.
+    Ambos modos pasan por la app ASGI (httpx) con la misma concurrencia: en el
+    modo por mensaje cada prospecto envía sus mensajes en orden y hasta
+    BATCH_MAX_CONCURRENCY prospectos envían a la vez, como hace el lote.
+    """
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["STUB_LLM_LATENCY_MS"] = str(latency_ms)
+    import httpx
+    import app as app_module
+    from config import SchedulingLimits
+    from scheduler import TenantScheduler
+    from tools import calendar_tools, crm_tools
+
+    # Sin límites de tenant: se mide el procesamiento del webhook, no el scheduler
+    app_module.scheduler = TenantScheduler(
+        max_concurrency=1024,
+        limits_loader=lambda tenant_id: SchedulingLimits(
+            max_concurrent_turns=1024, rate_per_second=1e6, burst=1_000_000
+        )
+    )
+    concurrency = app_module.BATCH_MAX_CONCURRENCY
+
+    def build_messages(prefix: str):
+        # Intercalados como llegan desde el gateway
+        return [
+            {"phone": f"+569{p:08d}", "message": f"Mensaje {m}", "tenant_id": prefix}
+            for m in range(messages_per_prospect)
+            for p in range(num_prospects)
+        ]
+
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            crm_tools.MOCK_DB_FILE = Path(tmp) / "crm.json"
+            calendar_tools.MOCK_CALENDAR_FILE = Path(tmp) / "calendar.json"
+            await send_all()
+
+    async def send_all():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Calienta imports y cachés de ADK fuera de la medición
+            warmup = {"phone": "+56900000000", "message": "Hola", "tenant_id": "bench_warmup"}
+            await client.post("/webhook/whatsapp", json=warmup)
+            await client.post("/webhook/whatsapp/batch", json={"messages": [warmup]})
+
+            single = build_messages("bench_single")
+            by_phone: Dict[str, List[dict]] = {}
+            for message in single:
+                by_phone.setdefault(message["phone"], []).append(message)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def send_in_order(messages: List[dict]):
+                async with semaphore:
+                    for message in messages:
+                        response = await client.post("/webhook/whatsapp", json=message)
+                        response.raise_for_status()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(send_in_order(messages) for messages in by_phone.values()))
+            single_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            response = await client.post(
+                "/webhook/whatsapp/batch", json={"messages": build_messages("bench_batch")}
+            )
+            batch_s = time.perf_counter() - start
+
+        assert all(item["success"] for item in response.json()["results"])
+        total = len(single)
+        print(f"{total} mensajes ({num_prospects} prospectos x {messages_per_prospect}), "
+              f"LLM stub {latency_ms:.0f} ms, concurrencia {concurrency} en ambos modos")
+        print(f"Un request por mensaje:  {single_s:8.2f} s  ({total / single_s:8.1f} msg/s)")
+        print(f"Lote:                    {batch_s:8.2f} s  ({total / batch_s:8.1f} msg/s)")
+
+    asyncio.run(run())
+
+
+def _percentile(samples, p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+def bench_resilience(num_turns: int):
+    """Deadline, hedging y circuit breaker con el LLM stub inyectando latencia y fallos"""
+    os.environ["LLM_BACKEND"] = "stub"
+    import agent
+    from resilience import (
+        DEGRADED_REPLY, TIMEOUT_REPLY, CircuitBreaker, HedgingPolicy
+    )
+
+    async def run_scenario(name: str, stub_env: dict, deadline: float, hedge: bool, concurrency: int = 20):
+        os.environ.update({key: str(value) for key, value in stub_env.items()})
+        agent.TURN_DEADLINE_SECONDS = deadline
+        agent.LLM_HEDGE_ENABLED = hedge
+        agent.hedging_policy = HedgingPolicy(percentile=95, initial_delay_seconds=0.3)
+        agent.llm_circuit_breaker = CircuitBreaker(min_requests=20, window_seconds=10, cooldown_seconds=60)
+
+        sessions = [
+            agent.InboundAgentSession(tenant_id="bench", prospect_phone=f"+569{i:08d}")
+            for i in range(num_turns)
+        ]
+        models = {id(session.agent.model): session.agent.model for session in sessions}
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, replies = [], []
+
+        async def turn(session):
+            async with semaphore:
+                start = time.perf_counter()
+                reply = await session.send_message_async("Hola, quiero info")
+                latencies.append(time.perf_counter() - start)
+                replies.append(reply)
+
+        await asyncio.gather(*(turn(session) for session in sessions))
+
+        llm_calls = sum(getattr(getattr(m, "inner", m), "calls", 0) for m in models.values())
+        breaker = agent.llm_circuit_breaker.metrics()
+        print(f"{name:<34} p50 {_percentile(latencies, 50) * 1000:7.0f} ms  "
+              f"p99 {_percentile(latencies, 99) * 1000:7.0f} ms  "
+              f"timeouts {replies.count(TIMEOUT_REPLY):3d}  "
+              f"degradado {replies.count(DEGRADED_REPLY):3d}  "
+              f"llamadas LLM {llm_calls:4d}  "
+              f"hedges {agent.hedging_policy.hedges:3d}  "
+              f"breaker {breaker['state']} (abierto {breaker['times_opened']}x)")
+
+    async def run():
+        # 5% de stragglers de 3 s sobre una latencia base de ~60 ms
+        stragglers = {
+            "STUB_LLM_LATENCY_MS": 50, "STUB_LLM_JITTER_MS": 20,
+            "STUB_LLM_SLOW_RATE": 0.05, "STUB_LLM_SLOW_MS": 3000,
+            "STUB_LLM_FAILURE_RATE": 0
+        }
+        print(f"{num_turns} turnos, 20 en paralelo, LLM stub")
+        await run_scenario("Stragglers sin protección", stragglers, deadline=float("inf"), hedge=False)
+        await run_scenario("Stragglers + deadline 1 s", stragglers, deadline=1.0, hedge=False)
+        await run_scenario("Stragglers + deadline 1 s + hedging", stragglers, deadline=1.0, hedge=True)
+
+        # 80% de fallos: el breaker corta las llamadas al LLM
+        failing = dict(stragglers, STUB_LLM_SLOW_RATE=0, STUB_LLM_FAILURE_RATE=0.8)
+        await run_scenario("Fallos 80% + circuit breaker", failing, deadline=1.0, hedge=False)
+
+    asyncio.run(run())
+
+
+def bench_profiling(num_turns: int):
+    """Costo de los hooks de profiling apagados vs requests perfilados"""
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["STUB_LLM_LATENCY_MS"] = "0"
+    import timeit
+    import app as app_module
+    import profiling
+    from config import SchedulingLimits
+    from scheduler import TenantScheduler
+    from tools import calendar_tools, crm_tools
+
+    # Sin límites de tenant: se mide el turno, no el scheduler
+    app_module.scheduler = TenantScheduler(
+        max_concurrency=1024,
+        limits_loader=lambda tenant_id: SchedulingLimits(rate_per_second=1e6, burst=1_000_000)
+    )
+
+    calls = 1_000_000
+    noop_s = timeit.timeit(lambda: profiling.span("bench").__enter__(), number=calls)
+    print(f"span() sin profiling activo: {noop_s / calls * 1e9:6.0f} ns por llamada")
+
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            crm_tools.MOCK_DB_FILE = Path(tmp) / "crm.json"
+            calendar_tools.MOCK_CALENDAR_FILE = Path(tmp) / "calendar.json"
+            app_module.profiler.output_dir = Path(tmp) / "profiles"
+            app_module.profiler.sample_rate = 0.0
+            app_module.profiler.token = "bench"
+
+            async def turns(prefix: str, header):
+                latencies = []
+                for i in range(num_turns):
+                    message = app_module.WhatsAppMessage(
+                        phone=f"+569{i % 20:08d}", message=f"Mensaje {i}", tenant_id=prefix
+                    )
+                    start = time.perf_counter()
+                    await app_module.whatsapp_webhook(message, header)
+                    latencies.append(time.perf_counter() - start)
+                return latencies
+
+            await turns("bench_warmup", None)
+            off = await turns("bench_off", None)
+            on = await turns("bench_on", "bench")
+            print(f"{num_turns} turnos secuenciales, LLM stub sin latencia")
+            for name, latencies in (("Profiling apagado", off), ("Perfilado (X-Profile)", on)):
+                print(f"{name:<22} p50 {_percentile(latencies, 50) * 1000:7.2f} ms  "
+                      f"p99 {_percentile(latencies, 99) * 1000:7.2f} ms")
+            print(f"Perfiles guardados: {len(list((Path(tmp) / 'profiles').glob('*.json')))}")
+
+    asyncio.run(run())
+
+
+def bench_logging(num_turns: int):
+    """Costo por turno en el hilo del request: prints vs logging estructurado en cola"""
+    import contextlib
+    import traceback
+    import structured_logging
+
+    phone, message = "+56912345678", "Hola, quiero información sobre el plan empresas"
+    reply = "¡Hola! Con gusto te ayudo. ¿Me cuentas un poco sobre tu empresa y qué necesitas?"
+
+    class SlowStream:
+        """Salida con contrapresión (pipe lleno, driver de logs remoto)"""
+        def __init__(self, stream, delay_seconds: float):
+            self.stream = stream
+            self.delay_seconds = delay_seconds
+
+        def write(self, text: str):
+            time.sleep(self.delay_seconds)
+            return self.stream.write(text)
+
+        def flush(self):
+            self.stream.flush()
+
+    def with_prints(out, turns: int, errors: int):
+        with contextlib.redirect_stdout(out):
+            for i in range(turns):
+                print(f"📨 Mensaje de {phone}: {message}")
+                print(f"🤖 Respuesta: {reply[:100]}...")
+                if i < errors:
+                    try:
+                        raise RuntimeError("Error del modelo")
+                    except RuntimeError as e:
+                        print(f"❌ Error en conversación: {e}")
+                        traceback.print_exc(file=out)
+
+    def with_structured(out, turns: int, errors: int):
+        logger = structured_logging.get_logger("bench")
+        with structured_logging.log_context(tenant_id="bench", session_id=f"bench_{phone}"):
+            for i in range(turns):
+                logger.info("message_received", phone=phone, message=message, sampled=True)
+                logger.info("reply_sent", response=reply, latency_ms=812.4, tool_calls=[], sampled=True)
+                if i < errors:
+                    try:
+                        raise RuntimeError("Error del modelo")
+                    except RuntimeError:
+                        logger.exception("turn_failed")
+
+    def measure(name: str, run, stream_factory, turns: int, sample_rate: float = None):
+        errors = turns // 100
+        with tempfile.TemporaryDirectory() as tmp:
+            # Con buffering de línea, como stdout en una terminal o con PYTHONUNBUFFERED
+            with open(Path(tmp) / "out.log", "w", buffering=1, encoding="utf-8") as f:
+                out = stream_factory(f)
+                dropped = 0
+                if sample_rate is not None:
+                    os.environ["LOG_INFO_SAMPLE_RATE"] = str(sample_rate)
+                    structured_logging.setup_logging(stream=out, force=True)
+                _, request_s = _timed(run, out, turns, errors)
+                if sample_rate is not None:
+                    dropped = structured_logging.logging_metrics()["dropped"]
+                    structured_logging.shutdown_logging()
+        print(f"  {name:<28}{request_s / turns * 1e6:10.1f} µs/turno  descartados {dropped}")
+
+    # En el loop sin pausas el listener compite por el GIL y la cola puede
+    # llenarse; en el servidor cada turno dura cientos de ms
+    print("2 logs info por turno + 1% de turnos con error y traceback")
+    for sink, factory, turns in (
+        ("archivo", lambda f: f, num_turns),
+        ("salida lenta (0.2 ms/write)", lambda f: SlowStream(f, 0.0002), max(num_turns // 20, 100))
+    ):
+        print(f"{turns} turnos, {sink}:")
+        measure("print() + print_exc()", with_prints, factory, turns)
+        measure("JSON en cola", with_structured, factory, turns, sample_rate=1.0)
+        measure("JSON en cola, muestreo 10%", with_structured, factory, turns, sample_rate=0.1)
+
+
+def bench_scheduling(latency_ms: float):
+    """Llamadas al LLM para agendar: tools de un horario vs tools por lote"""
+    os.environ["LLM_BACKEND"] = "stub"
+    import agent
+    from stub_llm import ScriptedLlm
+    from tools import calendar_tools, crm_tools
+
+    day = datetime.now().date() + timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    date = day.isoformat()
+    prospect = {"prospect_name": "Ana Pérez", "prospect_phone": "+56912345678", "prospect_email": "ana@empresa.cl"}
+
+    def check(time: str) -> dict:
+        return {"call": "check_availability", "args": {"date": date, "time": time}}
+
+    # Mismas conversaciones con las dos formas de usar las tools
+    conversations = {
+        "Ofrecer horarios": {
+            "message": "¿Qué horarios tienen disponibles?",
+            "one_by_one": [check(t) for t in ("09:00", "10:00", "11:00", "12:00", "14:00")]
+                          + [{"text": "Tengo 12:00 y 14:00"}],
+            "batched": [{"call": "find_available_slots", "args": {"start_date": date, "days": 1}},
+                        {"text": "Tengo 12:00 y 14:00"}]
+        },
+        "Agendar (10:00, 11:00 o 15:00)": {
+            "message": "Agéndame a las 10, si no a las 11 o a las 15",
+            "one_by_one": [check("10:00"), check("11:00"), check("15:00"),
+                           {"call": "schedule_meeting", "args": {**prospect, "date": date, "time": "15:00"}},
+                           {"text": "¡Listo! Quedó a las 15:00"}],
+            "batched": [{"call": "book_first_available",
+                         "args": {**prospect, "candidate_slots": [f"{date} {t}" for t in ("10:00", "11:00", "15:00")]}},
+                        {"text": "¡Listo! Quedó a las 15:00"}]
+        }
+    }
+
+    async def run_conversation(message: str, script: list):
+        session = agent.InboundAgentSession(tenant_id="bench", prospect_phone=prospect["prospect_phone"])
+        model = ScriptedLlm(latency_ms=latency_ms, script=script)
+        session.agent.model = model
+        start = time.perf_counter()
+        reply = await session.send_message_async(message)
+        return model.calls, time.perf_counter() - start, session.last_tool_calls, reply
+
+    async def run():
+        print(f"LLM stub con {latency_ms:.0f} ms por llamada; ocupados 09:00, 10:00 y 11:00 del {date}")
+        for name, conversation in conversations.items():
+            for variant in ("one_by_one", "batched"):
+                with tempfile.TemporaryDirectory() as tmp:
+                    calendar_tools.MOCK_CALENDAR_FILE = Path(tmp) / "calendar.json"
+                    crm_tools.MOCK_DB_FILE = Path(tmp) / "crm.json"
+                    calendar_tools.MOCK_CALENDAR_FILE.write_text(json.dumps({"meetings": [
+                        {"id": f"meeting_{i}", "date": date, "time": t}
+                        for i, t in enumerate(("09:00", "10:00", "11:00"), 1)
+                    ]}))
+                    calls, elapsed, tools, reply = await run_conversation(
+                        conversation["message"], conversation[variant]
+                    )
+                    booked = json.loads(calendar_tools.MOCK_CALENDAR_FILE.read_text())["meetings"][3:]
+                label = "una por horario" if variant == "one_by_one" else "por lote"
+                print(f"{name:<32} {label:<16} llamadas LLM {calls}  tools {len(tools)}  "
+                      f"{elapsed * 1000:6.0f} ms  agendadas {[m['time'] for m in booked]}")
+
+    asyncio.run(run())
+
+
+def bench_prefetch(num_prospects: int, latency_ms: float):
+    """Primera respuesta a prospectos nuevos y recurrentes, con y sin precarga del CRM"""
+    os.environ["LLM_BACKEND"] = "stub"
+    import agent
+    import app as app_module
+    from config import SchedulingLimits
+    from prospect_context import prefetch_prospect_context
+    from scheduler import TenantScheduler
+    from stub_llm import ScriptedLlm
+    from tools import calendar_tools, crm_tools
+
+    app_module.scheduler = TenantScheduler(
+        max_concurrency=1024,
+        limits_loader=lambda tenant_id: SchedulingLimits(rate_per_second=1e6, burst=1_000_000)
+    )
+    returning = [f"+5698{i:07d}" for i in range(0, num_prospects, num_prospects // 10)]
+    new = [f"+5697{i:07d}" for i in range(10)]
+
+    def no_prefetch(phone: str, tenant_id: str):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    # Sin precarga el modelo tiene que llamar get_prospect_info antes de responder
+    scenarios = [
+        ("Sin precarga", no_prefetch, lambda phone: [
+            {"call": "get_prospect_info", "args": {"phone": phone}}, {"text": "¡Hola!"}
+        ]),
+        ("Con precarga", prefetch_prospect_context, lambda phone: [{"text": "¡Hola!"}])
+    ]
+
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            crm_tools.MOCK_DB_FILE = Path(tmp) / "crm.json"
+            calendar_tools.MOCK_CALENDAR_FILE = Path(tmp) / "calendar.json"
+            crm_tools.MOCK_DB_FILE.write_text(json.dumps({"prospects": [
+                {
+                    "id": f"prospect_{i + 1}", "tenant_id": "bench", "name": f"Prospecto {i}",
+                    "phone": f"+5698{i:07d}", "email": f"p{i}@empresa.cl",
+                    "bant": {"budget": "5000 USD", "authority": "Gerente", "need": "CRM", "timeline": "Q3"},
+                    "qualification_status": "QUALIFIED", "notes": "Interesado en el plan anual",
+                    "created_at": "2025-01-01T10:00:00", "source": "whatsapp_inbound"
+                }
+                for i in range(num_prospects)
+            ]}))
+            calendar_tools.MOCK_CALENDAR_FILE.write_text(json.dumps({"meetings": []}))
+
+            print(f"CRM con {num_prospects} prospectos, LLM stub {latency_ms:.0f} ms por llamada")
+            for name, prefetch, script in scenarios:
+                app_module.prefetch_prospect_context = prefetch
+                for label, phones in (("nuevos", new), ("recurrentes", returning)):
+                    latencies, calls = [], 0
+                    for phone in phones:
+                        model = ScriptedLlm(latency_ms=latency_ms, script=script(phone))
+                        agent._get_model = lambda: model
+                        message = app_module.WhatsAppMessage(phone=phone, message="Hola", tenant_id="bench")
+                        start = time.perf_counter()
+                        await app_module.whatsapp_webhook(message, None)
+                        latencies.append(time.perf_counter() - start)
+                        calls += model.calls
+                        app_module.active_sessions.remove(f"bench_{phone}")
+                    print(f"{name:<14} {label:<12} primera respuesta p50 "
+                          f"{_percentile(latencies, 50) * 1000:6.0f} ms  llamadas LLM {calls / len(phones):.1f}")
+
+    asyncio.run(run())
+
+
+def bench_transcripts(num_turns: int, num_prospects: int):
+    """Historial de un prospecto: índice de offsets + mmap vs escanear los segmentos"""
+    from transcripts import TranscriptArchive
+
+    rng = random.Random(42)
+    phones = [f"+569{i:08d}" for i in range(num_prospects)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = TranscriptArchive(Path(tmp), segment_max_bytes=64 * 1024 * 1024)
+        start = time.perf_counter()
+        for i in range(num_turns):
+            archive.append(
+                "bench", rng.choice(phones), "bench_session",
+                f"Mensaje {i}: somos 40 vendedores y buscamos un CRM antes de fin de trimestre",
+                f"Respuesta {i}: ¡Perfecto! ¿Quién más participa en la decisión? 😊",
+                tool_calls=["save_to_crm"] if i % 10 == 0 else [], latency_ms=850.0
+            )
+        append_s = time.perf_counter() - start
+        archive.close()
+
+        archive = TranscriptArchive(Path(tmp), segment_max_bytes=64 * 1024 * 1024)
+        _, open_s = _timed(archive.open)
+        archive.close()
+
+        tracemalloc.start()
+        archive = TranscriptArchive(Path(tmp), segment_max_bytes=64 * 1024 * 1024)
+        archive.open()
+        index_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        stats = archive.stats()
+
+        sample = rng.sample(phones, min(2000, num_prospects))
+        latencies = [_timed(archive.history, "bench", phone, 50)[1] for phone in sample]
+
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        for phone in sample:
+            archive.history("bench", phone, 50)
+        fetch_peak = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+
+        # Sin índice: leer todos los segmentos filtrando por teléfono
+        def scan(phone: str):
+            needle = f'"phone": "{phone}"'.encode()
+            turns = []
+            for path in sorted(Path(tmp).glob("segment_*.log")):
+                with open(path, "rb") as f:
+                    for line in f:
+                        if needle in line:
+                            turns.append(json.loads(line))
+            return turns[-50:]
+
+        scan_latencies = [_timed(scan, phone)[1] for phone in sample[:3]]
+
+        erased = sum(archive.erase("bench", phone) for phone in phones[::10])
+        result = archive.compact()
+        archive.close()
+
+    print(f"Archivo: {num_turns} turnos de {num_prospects} prospectos en {stats['segments']} segmentos "
+          f"({stats['segment_bytes'] / 1e6:.0f} MB, índice {stats['index_bytes'] / 1e6:.0f} MB)")
+    print(f"Append:                        {append_s / num_turns * 1e6:8.1f} µs por turno")
+    print(f"Abrir (cargar índice):         {open_s:8.2f} s, {index_bytes / num_turns:.1f} B en memoria por turno")
+    print(f"Historial (50 turnos) p50/p99: {_percentile(latencies, 50) * 1000:8.3f} / "
+          f"{_percentile(latencies, 99) * 1000:.3f} ms, pico de memoria {fetch_peak / 1024:.0f} KB")
+    print(f"Escaneo de segmentos p50:      {_percentile(scan_latencies, 50) * 1000:8.0f} ms")
+    print(f"Compactación ({erased} turnos borrados): {result['seconds']:.1f} s, "
+          f"{result['bytes_before'] / 1e6:.0f} MB → {result['bytes_after'] / 1e6:.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks del agente inbound")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    analytics_parser = subparsers.add_parser("analytics", help="Analítica incremental vs escaneo del CRM")
+    analytics_parser.add_argument("--prospects", type=int, default=1_000_000)
+
+    sessions_parser = subparsers.add_parser("sessions", help="Tier frío de sesiones inactivas")
+    sessions_parser.add_argument("--sessions", type=int, default=200)
+    sessions_parser.add_argument("--turns", type=int, default=20)
+
+    batch_parser = subparsers.add_parser("batch", help="Webhook por mensaje vs webhook por lote")
+    batch_parser.add_argument("--prospects", type=int, default=50)
+    batch_parser.add_argument("--messages", type=int, default=4)
+    batch_parser.add_argument("--latency-ms", type=float, default=200)
+
+    resilience_parser = subparsers.add_parser("resilience", help="Deadline, hedging y circuit breaker")
+    resilience_parser.add_argument("--turns", type=int, default=300)
+
+    profiling_parser = subparsers.add_parser("profiling", help="Overhead de los hooks de profiling")
+    profiling_parser.add_argument("--turns", type=int, default=200)
+
+    logging_parser = subparsers.add_parser("logging", help="prints vs logging estructurado en cola")
+    logging_parser.add_argument("--turns", type=int, default=20000)
+
+    scheduling_parser = subparsers.add_parser("scheduling", help="Tools de agenda por horario vs por lote")
+    scheduling_parser.add_argument("--latency-ms", type=float, default=400)
+
+    prefetch_parser = subparsers.add_parser("prefetch", help="Precarga del CRM al crear la sesión")
+    prefetch_parser.add_argument("--prospects", type=int, default=20000)
+    prefetch_parser.add_argument("--latency-ms", type=float, default=400)
+
+    transcripts_parser = subparsers.add_parser("transcripts", help="Historial por índice de offsets vs escaneo")
+    transcripts_parser.add_argument("--turns", type=int, default=1_000_000)
+    transcripts_parser.add_argument("--prospects", type=int, default=50000)
+
+    args = parser.parse_args()
+    if args.command == "analytics":
+        bench_analytics(args.prospects)
+    elif args.command == "sessions":
+        bench_sessions(args.sessions, args.turns)
+    elif args.command == "batch":
+        bench_batch(args.prospects, args.messages, args.latency_ms)
+    elif args.command == "resilience":
+        bench_resilience(args.turns)
+    elif args.command == "profiling":
+        bench_profiling(args.turns)
+    elif args.command == "logging":
+        bench_logging(args.turns)
+    elif args.command == "scheduling":
+        bench_scheduling(args.latency_ms)
+    elif args.command == "prefetch":
+        bench_prefetch(args.prospects, args.latency_ms)
+    elif args.command == "transcripts":
+        bench_transcripts(args.turns, args.prospects)
@@ -33,6 +33,20 @@ class AgentPersonality(BaseModel):
     )
 
 
+class SchedulingLimits(BaseModel):
+    """Límites de uso del LLM por tenant (admisión y fair scheduling)"""
+    max_concurrent_turns: int = Field(default=4, description="Turnos LLM simultáneos por tenant")
+    rate_per_second: float = Field(default=2.0, description="Turnos por segundo (token bucket)")
+    burst: int = Field(default=5, description="Ráfaga máxima del token bucket")
+    weight: float = Field(default=1.0, description="Peso en el reparto justo entre tenants")
+    max_queue_size: int = Field(default=50, description="Turnos en cola antes de rechazar")
+    queue_deadline_seconds: float = Field(default=8.0, description="Espera máxima en cola")
+    prioritize_active_prospects: bool = Field(
+        default=True,
+        description="Atiende primero a prospectos con conversación en curso"
+    )
+
+
 class TenantConfig(BaseModel):
     """Configuración por tenant/cliente - Fácilmente escalable"""
     tenant_id: str
@@ -40,6 +54,7 @@ class TenantConfig(BaseModel):
     bant_criteria: BANTCriteria = Field(default_factory=BANTCriteria)
     crm_endpoint: str = Field(default="mock", description="Endpoint del CRM")
     calendar_endpoint: str = Field(default="mock", description="Endpoint del calendario")
+    scheduling: SchedulingLimits = Field(default_factory=SchedulingLimits)
     
     class Config:
         json_schema_extra = {
@@ -0,0 +1,310 @@
+"""
+Exportación en streaming de prospectos y reuniones (NDJSON o CSV).
+Lee los JSON mock registro por registro, así la memoria no crece con el
+tamaño del archivo, y permite retomar una exportación desde un cursor.
+
+Uso:
+    python export.py prospects --format csv --tenant company_001 -o leads.csv
+    python export.py meetings --start 2025-01-01 --end 2025-01-31
+    python export.py prospects --cursor 48213     # Retoma donde quedó
+"""
+import argparse
+import codecs
+import csv
+import io
+import itertools
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from tools import calendar_tools, crm_tools
+
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"\s*")
+
+# Columnas CSV por tipo de export (los campos BANT se aplanan)
+CSV_COLUMNS = {
+    "prospects": [
+        "id", "tenant_id", "name", "phone", "email",
+        "budget", "authority", "need", "timeline",
+        "qualification_status", "notes", "created_at", "source", "_cursor"
+    ],
+    "meetings": [
+        "id", "tenant_id", "prospect_name", "prospect_phone", "prospect_email",
+        "date", "time", "duration_minutes", "meeting_type", "status",
+        "created_at", "meeting_link", "_cursor"
+    ]
+}
+
+
+class InvalidCursor(ValueError):
+    """El cursor no apunta al final de un registro del archivo"""
+
+
+def _check_cursor(cursor: Optional[int]):
+    if cursor is not None and cursor < 0:
+        raise InvalidCursor(f"Cursor inválido: {cursor}")
+
+
+def _source(kind: str) -> Tuple[Path, str]:
+    """Archivo y clave del arreglo para cada tipo de export"""
+    if kind == "prospects":
+        crm_tools._ensure_data_dir()
+        return crm_tools.MOCK_DB_FILE, "prospects"
+    if kind == "meetings":
+        calendar_tools._ensure_data_dir()
+        return calendar_tools.MOCK_CALENDAR_FILE, "meetings"
+    raise ValueError(f"Tipo de export desconocido: {kind}")
+
+
+def iter_json_array(
+    path: Path,
+    key: str,
+    cursor: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE
+) -> Iterator[Tuple[Dict[str, Any], int]]:
+    """
+    Itera los elementos de `{"<key>": [...]}` sin cargar el archivo completo.
+
+    Args:
+        path: Archivo JSON
+        key: Clave del arreglo a recorrer
+        cursor: Offset en bytes retornado por una iteración anterior
+        chunk_size: Bytes leídos por lectura
+
+    Yields:
+        (registro, cursor) donde cursor es el offset en bytes justo después
+        del registro. Como el mock solo agrega registros al final, el cursor
+        sigue siendo válido después de nuevas escrituras.
+
+    Raises:
+        InvalidCursor: Si el cursor es negativo o no queda entre dos registros
+    """
+    _check_cursor(cursor)
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    with open(path, "rb") as f:
+        if cursor:
+            f.seek(cursor)
+        offset = f.tell()  # Offset en bytes de buffer[pos]
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def read_more() -> bool:
+            nonlocal buffer, pos, eof
+            if eof:
+                return False
+            data = f.read(chunk_size)
+            buffer = buffer[pos:] + utf8.decode(data, final=not data)
+            pos = 0
+            eof = not data
+            return not eof
+
+        def consume(until: int):
+            nonlocal pos, offset
+            offset += len(buffer[pos:until].encode("utf-8"))
+            pos = until
+
+        if not cursor:
+            # Avanza hasta el inicio del arreglo
+            opening = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+            while True:
+                match = opening.search(buffer)
+                if match:
+                    consume(match.end())
+                    break
+                if not read_more():
+                    raise ValueError(f"No se encontró el arreglo '{key}' en {path}")
+        else:
+            # Un cursor válido queda justo antes de ',' o ']'
+            while not buffer.strip() and read_more():
+                pass
+            if buffer.lstrip()[:1] not in (",", "]"):
+                raise InvalidCursor(f"Cursor inválido: {cursor}")
+
+        expect_separator = bool(cursor)
+        while True:
+            start = _WHITESPACE.match(buffer, pos).end()
+            if start == len(buffer):
+                if not read_more():
+                    raise ValueError(f"Arreglo '{key}' incompleto en {path}")
+                continue
+
+            char = buffer[start]
+            if char == "]":
+                return
+            if expect_separator:
+                if char != ",":
+                    raise ValueError(f"JSON inválido en {path}")
+                consume(start + 1)
+                expect_separator = False
+                continue
+
+            try:
+                record, end = decoder.raw_decode(buffer, start)
+            except json.JSONDecodeError:
+                # El registro puede estar cortado entre dos lecturas
+                if read_more():
+                    continue
+                if cursor:
+                    raise InvalidCursor(f"Cursor inválido: {cursor}")
+                raise
+
+            # Un cursor antes de una ',' entre campos de un registro pasa el
+            # chequeo inicial, pero lo que sigue es una clave, no un registro
+            if not isinstance(record, dict):
+                if cursor:
+                    raise InvalidCursor(f"Cursor inválido: {cursor}")
+                raise ValueError(f"Elemento que no es un registro en {path}")
+
+            consume(end)
+            expect_separator = True
+            yield record, offset
+
+
+def _matches(kind: str, record: Dict[str, Any], filters: Dict[str, Optional[str]]) -> bool:
+    """Aplica filtros de tenant, rango de fechas y estado"""
+    tenant_id = filters.get("tenant_id")
+    if tenant_id and (record.get("tenant_id") or "default") != tenant_id:
+        return False
+
+    # Prospectos por fecha de registro, reuniones por fecha de la reunión
+    day = (record.get("created_at") or "")[:10] if kind == "prospects" else record.get("date") or ""
+    if filters.get("start") and day < filters["start"]:
+        return False
+    if filters.get("end") and day > filters["end"]:
+        return False
+
+    status = filters.get("status")
+    field = "qualification_status" if kind == "prospects" else "status"
+    if status and record.get(field) != status:
+        return False
+
+    return True
+
+
+def _flatten(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Aplana el sub-dict BANT para CSV"""
+    flat = {k: v for k, v in record.items() if k != "bant"}
+    flat.update(record.get("bant") or {})
+    return flat
+
+
+def export_records(
+    kind: str,
+    fmt: str = "ndjson",
+    tenant_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    status: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None
+) -> Iterator[str]:
+    """
+    Prepara las líneas del export (NDJSON o CSV con encabezado).
+
+    Cada registro incluye `_cursor`: pasarlo como `cursor` retoma el export
+    justo después de ese registro.
+
+    Args:
+        kind: "prospects" o "meetings"
+        fmt: "ndjson" o "csv"
+        tenant_id: Filtra por tenant
+        start: Fecha inicial YYYY-MM-DD (inclusive)
+        end: Fecha final YYYY-MM-DD (inclusive)
+        status: qualification_status (prospectos) o status (reuniones)
+        cursor: Cursor de un export anterior
+        limit: Máximo de registros a exportar
+
+    Returns:
+        Iterador de líneas de texto terminadas en salto de línea
+
+    Raises:
+        InvalidCursor: Si el cursor no corresponde a un registro (se valida
+            al llamar, antes de generar la primera línea)
+    """
+    if fmt not in ("ndjson", "csv"):
+        raise ValueError(f"Formato desconocido: {fmt}")
+
+    path, key = _source(kind)
+    records = iter_json_array(path, key, cursor)
+    # Lee el primer registro ya para validar el cursor
+    first = next(records, None)
+    if first is not None:
+        records = itertools.chain([first], records)
+
+    filters = {"tenant_id": tenant_id, "start": start, "end": end, "status": status}
+    return _export_lines(kind, fmt, records, filters, limit)
+
+
+def _export_lines(
+    kind: str,
+    fmt: str,
+    records: Iterator[Tuple[Dict[str, Any], int]],
+    filters: Dict[str, Optional[str]],
+    limit: Optional[int]
+) -> Iterator[str]:
+    """Filtra los registros y los serializa línea por línea"""
+    if fmt == "csv":
+        line = io.StringIO()
+        writer = csv.DictWriter(line, fieldnames=CSV_COLUMNS[kind], extrasaction="ignore")
+        writer.writeheader()
+        yield line.getvalue()
+
+    exported = 0
+    if limit is not None and limit <= 0:
+        return
+
+    for record, record_cursor in records:
+        if not _matches(kind, record, filters):
+            continue
+
+        record["_cursor"] = record_cursor
+        if fmt == "ndjson":
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+        else:
+            line.seek(0)
+            line.truncate()
+            writer.writerow(_flatten(record))
+            yield line.getvalue()
+
+        exported += 1
+        if limit is not None and exported >= limit:
+            return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta prospectos o reuniones en streaming")
+    parser.add_argument("kind", choices=["prospects", "meetings"])
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--tenant", dest="tenant_id")
+    parser.add_argument("--start", help="Fecha inicial YYYY-MM-DD")
+    parser.add_argument("--end", help="Fecha final YYYY-MM-DD")
+    parser.add_argument("--status", help="qualification_status o status de la reunión")
+    parser.add_argument("--cursor", type=int, help="Retoma desde el _cursor de un export anterior")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("-o", "--output", help="Archivo de salida (default: stdout)")
+    args = parser.parse_args()
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    count = 0
+    try:
+        for line in export_records(
+            args.kind, args.format, args.tenant_id, args.start, args.end,
+            args.status, args.cursor, args.limit
+        ):
+            out.write(line)
+            count += 1
+    finally:
+        if args.output:
+            out.close()
+
+    if args.format == "csv":
+        count -= 1
+    print(f"✅ {count} registros exportados", file=sys.stderr)
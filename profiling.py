@@ -0,0 +1,298 @@
+"""
+Profiling opt-in de requests del webhook.
+
+Un request se perfila si:
+- trae el header `X-Profile` con el valor de PROFILING_TOKEN,
+- cae en el muestreo PROFILING_SAMPLE_RATE, o
+- quedó armado desde POST /admin/profiling (header X-Admin-Token = PROFILING_TOKEN).
+
+Sin PROFILING_TOKEN configurado solo funciona el muestreo: el header y los
+endpoints /admin se rechazan.
+
+Por cada request perfilado se guarda en data/profiles/:
+- <id>.json: timeline de spans (LLM, cada tool, I/O de los JSON mock, etc.)
+- <id>.prof: perfil cProfile (abrir con `python -m pstats` o snakeviz)
+
+Si el request no se perfila, `span()` retorna un context manager vacío
+compartido: el costo es leer una ContextVar.
+"""
+import contextlib
+import cProfile
+import hmac
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from structured_logging import get_logger
+
+
+PROFILES_DIR = Path(__file__).parent / "data" / "profiles"
+
+logger = get_logger(__name__)
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+_NOOP = contextlib.nullcontext()
+
+
+class RequestProfile:
+    """Timeline de spans de un request"""
+
+    def __init__(self, label: Dict[str, Any], reason: str):
+        self.id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self.label = label
+        self.reason = reason
+        self.spans: List[Dict[str, Any]] = []
+        self._open: Dict[Any, Dict[str, Any]] = {}
+        self._start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self.cpu_profile: Optional[cProfile.Profile] = None
+
+    def _offset_ms(self) -> float:
+        return round((time.perf_counter() - self._start) * 1000, 3)
+
+    def begin(self, key: Any, name: str, **attrs):
+        """Abre un span que se cierra con end(key) (para pares de callbacks)"""
+        self._open[key] = {
+            "name": name,
+            "start_ms": self._offset_ms(),
+            "thread": threading.current_thread().name,
+            **attrs
+        }
+
+    def end(self, key: Any, **attrs):
+        entry = self._open.pop(key, None)
+        if entry is None:
+            return
+        entry["duration_ms"] = round(self._offset_ms() - entry["start_ms"], 3)
+        entry.update(attrs)
+        self.spans.append(entry)
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Spans sin cerrar (p.ej. el modelo falló antes del after callback)
+        spans = self.spans + [
+            {**entry, "duration_ms": None, "unfinished": True}
+            for entry in self._open.values()
+        ]
+        spans.sort(key=lambda entry: entry["start_ms"])
+
+        totals: Dict[str, Dict[str, float]] = {}
+        for entry in spans:
+            total = totals.setdefault(entry["name"], {"count": 0, "total_ms": 0.0})
+            total["count"] += 1
+            total["total_ms"] = round(total["total_ms"] + (entry["duration_ms"] or 0), 3)
+
+        return {
+            "id": self.id,
+            "reason": self.reason,
+            **self.label,
+            "wall_ms": self._offset_ms(),
+            "cpu_ms": round((time.process_time() - self._cpu_start) * 1000, 3),
+            "cpu_profile": f"{self.id}.prof" if self.cpu_profile else None,
+            "totals": totals,
+            "spans": spans
+        }
+
+
+class _Span:
+    """Span activo (solo se crea si el request se está perfilando)"""
+
+    __slots__ = ("profile", "key", "name", "attrs")
+
+    def __init__(self, profile: RequestProfile, name: str, attrs: Dict[str, Any]):
+        self.profile = profile
+        self.key = object()
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.profile.begin(self.key, self.name, **self.attrs)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.profile.end(self.key, error=exc_type.__name__)
+        else:
+            self.profile.end(self.key)
+        return False
+
+
+def current_profile() -> Optional[RequestProfile]:
+    """Perfil del request en curso, o None si no se está perfilando"""
+    return _current.get()
+
+
+def span(name: str, **attrs):
+    """
+    Context manager que registra un span en el perfil del request en curso.
+
+    Ejemplo:
+        with span("storage.load", file="crm_mock.json"):
+            ...
+    """
+    profile = _current.get()
+    if profile is None:
+        return _NOOP
+    return _Span(profile, name, attrs)
+
+
+# Callbacks de ADK: spans de cada llamada al modelo y cada tool
+def before_model_callback(callback_context, llm_request):
+    profile = _current.get()
+    if profile is not None:
+        profile.begin(("llm", callback_context.invocation_id), "llm", model=llm_request.model)
+    return None
+
+
+def after_model_callback(callback_context, llm_response):
+    profile = _current.get()
+    if profile is not None:
+        usage = llm_response.usage_metadata
+        profile.end(
+            ("llm", callback_context.invocation_id),
+            tokens=usage.total_token_count if usage else None
+        )
+    return None
+
+
+def before_tool_callback(tool, args, tool_context):
+    profile = _current.get()
+    if profile is not None:
+        profile.begin(("tool", tool_context.function_call_id), f"tool.{tool.name}")
+    return None
+
+
+def after_tool_callback(tool, args, tool_context, tool_response):
+    profile = _current.get()
+    if profile is not None:
+        profile.end(("tool", tool_context.function_call_id))
+    return None
+
+
+class Profiler:
+    """Decide qué requests se perfilan y guarda los resultados"""
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        token: Optional[str] = None,
+        output_dir: Path = PROFILES_DIR
+    ):
+        self.sample_rate = sample_rate
+        self.token = token
+        self.output_dir = output_dir
+
+        self._armed = 0
+        self._armed_tenant: Optional[str] = None
+        # cProfile es global al hilo: solo un request a la vez lleva perfil de CPU
+        self._cpu_busy = False
+        self.captured = 0
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        return cls(
+            sample_rate=float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+            token=os.getenv("PROFILING_TOKEN") or None
+        )
+
+    def check_token(self, value: Optional[str]) -> bool:
+        """Valida el token de /admin/profiling y del header X-Profile (sin token configurado, rechaza)"""
+        if not self.token or not value:
+            return False
+        return hmac.compare_digest(value.encode("utf-8"), self.token.encode("utf-8"))
+
+    def arm(self, requests: int, tenant_id: Optional[str] = None):
+        """Perfila los próximos `requests` requests (opcionalmente de un tenant)"""
+        self._armed = max(requests, 0)
+        self._armed_tenant = tenant_id
+
+    def reason_for(self, header: Optional[str], tenant_id: str) -> Optional[str]:
+        """Motivo para perfilar el request, o None si no corresponde"""
+        if header and self.check_token(header):
+            return "header"
+        if self._armed and self._armed_tenant in (None, tenant_id):
+            self._armed -= 1
+            return "armed"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    @contextlib.contextmanager
+    def capture(self, reason: str, **label):
+        """
+        Perfila el bloque: activa el timeline de spans para el contexto actual
+        y, si está libre, cProfile. Al salir guarda ambos en output_dir.
+
+        El perfil de CPU incluye todo lo que corre en el event loop mientras
+        dura el request (también otros requests concurrentes).
+        """
+        profile = RequestProfile(label, reason)
+        if not self._cpu_busy:
+            self._cpu_busy = True
+            profile.cpu_profile = cProfile.Profile()
+            profile.cpu_profile.enable()
+
+        token = _current.set(profile)
+        try:
+            yield profile
+        finally:
+            _current.reset(token)
+            if profile.cpu_profile is not None:
+                profile.cpu_profile.disable()
+                self._cpu_busy = False
+            try:
+                self._save(profile)
+            except Exception:
+                logger.exception("profile_save_failed", profile_id=profile.id)
+
+    def _save(self, profile: RequestProfile):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        data = profile.to_dict()
+        with open(self.output_dir / f"{profile.id}.json", "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        if profile.cpu_profile is not None:
+            profile.cpu_profile.dump_stats(str(self.output_dir / f"{profile.id}.prof"))
+        self.captured += 1
+        logger.info("profile_saved", profile_id=profile.id, wall_ms=data["wall_ms"], reason=profile.reason)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "sample_rate": self.sample_rate,
+            "armed_requests": self._armed,
+            "armed_tenant": self._armed_tenant,
+            "captured": self.captured,
+            "output_dir": str(self.output_dir)
+        }
+
+    def list_profiles(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Resumen de los perfiles guardados más recientes"""
+        if not self.output_dir.exists():
+            return []
+        files = sorted(self.output_dir.glob("*.json"), reverse=True)[:limit]
+        profiles = []
+        for path in files:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            data.pop("spans", None)
+            profiles.append(data)
+        return profiles
+
+    def load(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """Perfil completo (con spans) por id"""
+        path = self.output_dir / f"{Path(profile_id).name}.json"
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+profiler = Profiler.from_env()
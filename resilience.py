@@ -0,0 +1,287 @@
+"""
+Protecciones de latencia y errores para las llamadas al LLM.
+
+- LatencyTracker: percentiles del tiempo hasta el primer evento del modelo.
+- HedgedLlm: si el modelo no responde dentro del percentil configurado,
+  lanza una segunda llamada idéntica y se queda con la primera que responda.
+- CircuitBreaker: si la tasa de errores/timeouts se dispara, pasa a modo
+  degradado y responde con un fallback sin llamar al LLM.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Deque, Dict, Optional, Tuple, Union
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+
+
+# Respuestas cuando el turno no se puede completar a tiempo. Nada reintenta
+# el turno ni envía un mensaje después: se le pide al prospecto reenviarlo.
+# (Tras un timeout una tool pudo alcanzar a guardar; al reenviar, el modelo
+# lo ve en el historial de la sesión.)
+TIMEOUT_REPLY = (
+    "¡Perdón por la demora! 🙏 No alcancé a procesar tu mensaje a tiempo. "
+    "¿Me lo reenvías, por favor?"
+)
+DEGRADED_REPLY = (
+    "¡Gracias por tu mensaje! En este momento tenemos una intermitencia en el "
+    "sistema y no pude leerlo. ¿Me lo reenvías en unos minutos? 🙌"
+)
+
+
+class LatencyTracker:
+    """Ventana deslizante de latencias para calcular percentiles"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Percentil p (0-100) de la ventana, o None si está vacía"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(int(len(ordered) * p / 100), len(ordered) - 1)
+        return ordered[index]
+
+
+class HedgingPolicy:
+    """Configuración y métricas compartidas por todas las instancias de HedgedLlm"""
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        min_samples: int = 20,
+        initial_delay_seconds: float = 2.0,
+        min_delay_seconds: float = 0.2
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay_seconds = initial_delay_seconds
+        self.min_delay_seconds = min_delay_seconds
+        self.first_event_latency = LatencyTracker()
+
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @classmethod
+    def from_env(cls) -> "HedgingPolicy":
+        return cls(
+            percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+            initial_delay_seconds=float(os.getenv("LLM_HEDGE_INITIAL_DELAY_SECONDS", "2.0"))
+        )
+
+    def hedge_delay(self) -> float:
+        """Segundos a esperar el primer evento antes de lanzar la llamada duplicada"""
+        if len(self.first_event_latency) < self.min_samples:
+            return self.initial_delay_seconds
+        return max(self.first_event_latency.percentile(self.percentile), self.min_delay_seconds)
+
+    def metrics(self) -> Dict[str, Any]:
+        p50 = self.first_event_latency.percentile(50)
+        p99 = self.first_event_latency.percentile(99)
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 1),
+            "first_event_ms_p50": round(p50 * 1000, 1) if p50 is not None else None,
+            "first_event_ms_p99": round(p99 * 1000, 1) if p99 is not None else None
+        }
+
+
+class HedgedLlm(BaseLlm):
+    """
+    Envuelve un modelo de ADK y hace hedging de sus llamadas.
+    Las llamadas al modelo no tienen efectos en la sesión (esos los aplica el
+    runner con la respuesta), así que duplicarlas es seguro.
+    """
+
+    inner: BaseLlm
+    policy: Any  # HedgingPolicy
+
+    @classmethod
+    def wrap(cls, model: Union[str, BaseLlm], policy: HedgingPolicy) -> "HedgedLlm":
+        """Envuelve un nombre de modelo (p.ej. "gemini-2.0-flash") o una instancia"""
+        if isinstance(model, str):
+            from google.adk.models.registry import LLMRegistry
+            model = LLMRegistry.new_llm(model)
+        return cls(model=model.model, inner=model, policy=policy)
+
+    @property
+    def capabilities(self):
+        return self.inner.capabilities
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        policy: HedgingPolicy = self.policy
+        policy.requests += 1
+        start = time.monotonic()
+
+        # Copia antes de la primera llamada: el modelo puede modificar el request
+        hedge_request = llm_request.model_copy(deep=True)
+        primary = self.inner.generate_content_async(llm_request, stream=stream)
+        attempts = {asyncio.ensure_future(primary.__anext__()): primary}
+
+        winner: Optional[Tuple[LlmResponse, AsyncGenerator]] = None
+        try:
+            done, _ = await asyncio.wait(attempts.keys(), timeout=policy.hedge_delay())
+            if not done:
+                policy.hedges += 1
+                secondary = self.inner.generate_content_async(hedge_request, stream=stream)
+                attempts[asyncio.ensure_future(secondary.__anext__())] = secondary
+
+            winner = await self._first_success(attempts)
+            if winner is None:
+                return
+
+            policy.first_event_latency.record(time.monotonic() - start)
+            first, generator = winner
+            if generator is not primary:
+                policy.hedge_wins += 1
+
+            yield first
+            async for response in generator:
+                yield response
+        finally:
+            # Cancela la llamada perdedora y cierra todos los generadores
+            for task, generator in attempts.items():
+                if not task.done():
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                try:
+                    await generator.aclose()
+                except Exception:
+                    pass
+
+    @staticmethod
+    async def _first_success(attempts: Dict[asyncio.Future, AsyncGenerator]):
+        """Primer evento exitoso entre los intentos; relanza el error si todos fallan"""
+        pending = set(attempts.keys())
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    return task.result(), attempts[task]
+                except StopAsyncIteration:
+                    return None
+                except Exception as e:
+                    error = e
+        raise error
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de errores en una ventana de tiempo.
+
+    closed → open cuando, con al menos `min_requests` en la ventana, la tasa de
+    fallos supera `failure_rate_threshold`. Tras `cooldown_seconds` pasa a
+    half_open y deja pasar una llamada de prueba: si funciona vuelve a closed,
+    si falla vuelve a open.
+    """
+
+    def __init__(
+        self,
+        failure_rate_threshold: float = 0.5,
+        min_requests: int = 10,
+        window_seconds: float = 30,
+        cooldown_seconds: float = 20
+    ):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_requests = min_requests
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+
+        self.state = "closed"
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        return cls(
+            failure_rate_threshold=float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5")),
+            min_requests=int(os.getenv("LLM_BREAKER_MIN_REQUESTS", "10")),
+            window_seconds=float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", "30")),
+            cooldown_seconds=float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "20"))
+        )
+
+    def allow_request(self) -> bool:
+        """True si el turno puede llamar al LLM"""
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.cooldown_seconds:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+
+        return True
+
+    def record_success(self):
+        if self.state == "half_open":
+            self._close()
+            return
+        self._record(True)
+
+    def record_failure(self):
+        if self.state == "half_open":
+            self._open()
+            return
+        self._record(False)
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        if (
+            len(self._outcomes) >= self.min_requests
+            and failures / len(self._outcomes) >= self.failure_rate_threshold
+        ):
+            self._open()
+
+    def record_abandoned(self):
+        """El turno se canceló sin resultado (p.ej. el cliente cortó la conexión)"""
+        if self.state == "half_open":
+            self._probe_in_flight = False
+
+    def _record(self, ok: bool):
+        now = time.monotonic()
+        self._outcomes.append((now, ok))
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._outcomes.clear()
+        self.times_opened += 1
+
+    def _close(self):
+        self.state = "closed"
+        self._probe_in_flight = False
+        self._outcomes.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return {
+            "state": self.state,
+            "window_requests": len(self._outcomes),
+            "window_failures": failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,338 @@
+"""
+Scheduler de turnos LLM multi-tenant.
+Todos los tenants comparten la misma cuota de Gemini: este módulo limita la
+concurrencia y la tasa de cada tenant, reparte la capacidad global con
+weighted fair queueing y descarta carga cuando la espera supera el deadline.
+"""
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from config import SchedulingLimits, load_tenant_config
+
+
+T = TypeVar("T")
+
+# Estados de tenants sin actividad por más de este tiempo se descartan
+# (tenant_id viene del cliente: sin esto el dict crece sin límite)
+IDLE_TENANT_TTL_SECONDS = 300.0
+
+# Respuesta que recibe el prospecto cuando no hay capacidad para atenderlo.
+# El mensaje descartado no llega a la sesión ni se reintenta: se le pide
+# reenviarlo en vez de prometer una respuesta que nunca se envía.
+FALLBACK_REPLY = (
+    "¡Gracias por escribirnos! 🙌 En este momento estamos atendiendo muchas "
+    "conversaciones y no alcancé a leer tu mensaje. ¿Me lo reenvías en unos minutos?"
+)
+
+
+class SchedulerOverloaded(Exception):
+    """El turno fue rechazado por cola llena o por exceder el deadline"""
+
+    def __init__(self, tenant_id: str, reason: str):
+        self.tenant_id = tenant_id
+        self.reason = reason
+        super().__init__(f"Tenant {tenant_id} sin capacidad ({reason})")
+
+
+class TokenBucket:
+    """Token bucket clásico: `rate` tokens por segundo, hasta `burst` acumulados"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_until_available(self, now: float) -> float:
+        """Segundos hasta tener un token (0 si ya hay uno)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+@dataclass(eq=False)
+class _Waiter:
+    """Turno esperando su slot"""
+    future: asyncio.Future
+    enqueued_at: float
+    priority: bool
+
+
+class _TenantState:
+    """Colas, límites y métricas de un tenant"""
+
+    def __init__(self, tenant_id: str, limits: SchedulingLimits):
+        self.tenant_id = tenant_id
+        self.limits = limits
+        self.bucket = TokenBucket(limits.rate_per_second, limits.burst)
+        self.priority_queue: Deque[_Waiter] = deque()
+        self.queue: Deque[_Waiter] = deque()
+        self.running = 0
+        # Start tag del próximo turno (start-time fair queueing)
+        self.virtual_time = 0.0
+        self.last_active = time.monotonic()
+
+        # Métricas
+        self.admitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected_queue_full = 0
+        self.shed_deadline = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def queued(self) -> int:
+        return len(self.priority_queue) + len(self.queue)
+
+    def is_idle(self, now: float, ttl: float) -> bool:
+        """Sin turnos, inactivo por `ttl` segundos y con el bucket lleno"""
+        return (
+            not self.queued()
+            and not self.running
+            and now - self.last_active >= ttl
+            and self.bucket.is_full(now)
+        )
+
+    def pop(self) -> _Waiter:
+        return self.priority_queue.popleft() if self.priority_queue else self.queue.popleft()
+
+    def remove(self, waiter: _Waiter):
+        queue = self.priority_queue if waiter.priority else self.queue
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+
+    def metrics(self, now: float) -> Dict[str, Any]:
+        heads = [q[0].enqueued_at for q in (self.priority_queue, self.queue) if q]
+        return {
+            "queued": self.queued(),
+            "queued_priority": len(self.priority_queue),
+            "running": self.running,
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected_queue_full": self.rejected_queue_full,
+            "shed_deadline": self.shed_deadline,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "oldest_queued_ms": round((now - min(heads)) * 1000, 2) if heads else 0.0,
+            "tokens_available": round(self.bucket.tokens, 2),
+            "limits": self.limits.model_dump()
+        }
+
+
+class TenantScheduler:
+    """
+    Control de admisión para los turnos del agente.
+
+    - Cada tenant tiene un tope de turnos simultáneos y un token bucket.
+    - La capacidad global (`max_concurrency`) se reparte entre tenants con
+      start-time fair queueing ponderado por `weight`.
+    - Dentro de un tenant, los prospectos a mitad de calificación van primero.
+    - Si la cola está llena o el turno espera más que el deadline, se lanza
+      SchedulerOverloaded para responder con un fallback en vez de hacer timeout.
+    - Los tenants inactivos por `idle_ttl` se descartan (y sus métricas con ellos).
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        limits_loader: Optional[Callable[[str], SchedulingLimits]] = None,
+        idle_ttl: float = IDLE_TENANT_TTL_SECONDS
+    ):
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self.idle_ttl = idle_ttl
+        self._limits_loader = limits_loader or (lambda tenant_id: load_tenant_config(tenant_id).scheduling)
+        self._tenants: Dict[str, _TenantState] = {}
+        # Solo los tenants con turnos en cola participan del dispatch
+        self._backlogged: Dict[str, _TenantState] = {}
+        self._next_eviction = time.monotonic() + idle_ttl
+        self._virtual_clock = 0.0
+        self._retry_handle: Optional[asyncio.TimerHandle] = None
+        self._retry_at = float("inf")
+
+    def _tenant(self, tenant_id: str) -> _TenantState:
+        now = time.monotonic()
+        if now >= self._next_eviction:
+            self._evict_idle(now)
+
+        state = self._tenants.get(tenant_id)
+        if state is None:
+            state = _TenantState(tenant_id, self._limits_loader(tenant_id))
+            self._tenants[tenant_id] = state
+        state.last_active = now
+        return state
+
+    def _evict_idle(self, now: float):
+        """Descarta los tenants inactivos (a lo más una pasada cada idle_ttl)"""
+        self._next_eviction = now + self.idle_ttl
+        for tenant_id in [tid for tid, state in self._tenants.items() if state.is_idle(now, self.idle_ttl)]:
+            del self._tenants[tenant_id]
+
+    async def run(
+        self,
+        tenant_id: str,
+        turn: Callable[[], Awaitable[T]],
+        priority: bool = False
+    ) -> T:
+        """
+        Ejecuta un turno respetando los límites del tenant.
+
+        Args:
+            tenant_id: ID del tenant
+            turn: Función que crea la corutina del turno (solo se llama al obtener slot)
+            priority: True si el prospecto ya está a mitad de calificación
+
+        Returns:
+            El resultado del turno
+
+        Raises:
+            SchedulerOverloaded: Si no hubo capacidad dentro del deadline
+        """
+        state = await self._acquire(tenant_id, priority)
+        try:
+            result = await turn()
+            state.completed += 1
+            return result
+        except Exception:
+            state.failed += 1
+            raise
+        finally:
+            self._release(state)
+
+    async def _acquire(self, tenant_id: str, priority: bool) -> _TenantState:
+        state = self._tenant(tenant_id)
+        limits = state.limits
+
+        if state.queued() >= limits.max_queue_size:
+            state.rejected_queue_full += 1
+            raise SchedulerOverloaded(tenant_id, "queue_full")
+
+        # Un tenant que vuelve a tener trabajo no acumula crédito del tiempo inactivo
+        if not state.queued() and not state.running:
+            state.virtual_time = max(state.virtual_time, self._virtual_clock)
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(
+            future=loop.create_future(),
+            enqueued_at=time.monotonic(),
+            priority=priority and limits.prioritize_active_prospects
+        )
+        (state.priority_queue if waiter.priority else state.queue).append(waiter)
+        self._backlogged[tenant_id] = state
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=limits.queue_deadline_seconds)
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                # Obtuvo el slot justo al vencer el deadline
+                return state
+            waiter.future.cancel()
+            state.remove(waiter)
+            state.shed_deadline += 1
+            raise SchedulerOverloaded(tenant_id, "deadline")
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(state)
+            else:
+                waiter.future.cancel()
+                state.remove(waiter)
+            raise
+
+        return state
+
+    def _release(self, state: _TenantState):
+        state.running -= 1
+        self.running -= 1
+        state.last_active = time.monotonic()
+        self._dispatch()
+
+    def _dispatch(self):
+        """Asigna slots libres al tenant elegible con menor tiempo virtual"""
+        now = time.monotonic()
+        retry_in = float("inf")
+
+        while self.running < self.max_concurrency:
+            best: Optional[_TenantState] = None
+            for state in list(self._backlogged.values()):
+                if not state.queued():
+                    # Se vació (turnos atendidos o descartados por deadline)
+                    del self._backlogged[state.tenant_id]
+                    continue
+                if state.running >= state.limits.max_concurrent_turns:
+                    continue
+                wait = state.bucket.seconds_until_available(now)
+                if wait > 0:
+                    retry_in = min(retry_in, wait)
+                    continue
+                if best is None or state.virtual_time < best.virtual_time:
+                    best = state
+
+            if best is None:
+                break
+
+            waiter = best.pop()
+            best.bucket.consume()
+            best.running += 1
+            self.running += 1
+            self._virtual_clock = best.virtual_time
+            best.virtual_time += 1.0 / max(best.limits.weight, 1e-6)
+
+            waited = now - waiter.enqueued_at
+            best.admitted += 1
+            best.total_wait += waited
+            best.max_wait = max(best.max_wait, waited)
+            waiter.future.set_result(None)
+
+        if retry_in != float("inf"):
+            self._schedule_retry(now + retry_in)
+
+    def _schedule_retry(self, at: float):
+        """Reintenta el dispatch cuando algún token bucket se recargue"""
+        if self._retry_handle is not None and self._retry_at <= at:
+            return
+        if self._retry_handle is not None:
+            self._retry_handle.cancel()
+
+        def _fire():
+            self._retry_handle = None
+            self._retry_at = float("inf")
+            self._dispatch()
+
+        self._retry_at = at
+        self._retry_handle = asyncio.get_running_loop().call_later(
+            max(at - time.monotonic(), 0), _fire
+        )
+
+    def metrics(self, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+        """Métricas de colas por tenant (o de un tenant específico)"""
+        now = time.monotonic()
+        if tenant_id is not None:
+            state = self._tenants.get(tenant_id)
+            return state.metrics(now) if state else {}
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "tenants": {tid: state.metrics(now) for tid, state in self._tenants.items()}
+        }
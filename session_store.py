@@ -0,0 +1,236 @@
+"""
+Almacenamiento de sesiones en dos niveles.
+Las sesiones activas viven como objetos (tier caliente). Las que llevan más
+de `idle_seconds` sin mensajes se serializan y comprimen en un blob (tier frío)
+y se rehidratan cuando el prospecto vuelve a escribir.
+"""
+import asyncio
+import json
+import time
+import zlib
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from profiling import span
+from structured_logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class _ColdSession:
+    """Sesión congelada: snapshot comprimido + estado para listados"""
+    blob: bytes
+    raw_size: int
+    status: Dict[str, Any]
+    frozen_at: float
+
+
+class SessionStore:
+    """
+    Sesiones de agente por session_id con tier caliente y tier frío.
+
+    Las sesiones deben implementar `to_snapshot()` (async) y
+    `get_qualification_status()`; `restore` reconstruye una sesión desde
+    su snapshot (p.ej. InboundAgentSession.from_snapshot).
+    """
+
+    def __init__(
+        self,
+        restore: Callable[[dict], Awaitable[Any]],
+        idle_seconds: float = 900,
+        compression_level: int = 6
+    ):
+        self.restore = restore
+        self.idle_seconds = idle_seconds
+        self.compression_level = compression_level
+
+        self._hot: Dict[str, Any] = {}
+        self._cold: Dict[str, _ColdSession] = {}
+        self._last_active: Dict[str, float] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._rehydrating: Dict[str, asyncio.Future] = {}
+
+        # Métricas
+        self.freezes = 0
+        self.rehydrations = 0
+        self._rehydrate_latencies: List[float] = []
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._hot or session_id in self._cold
+
+    def __len__(self) -> int:
+        return len(self._hot) + len(self._cold)
+
+    async def get(self, session_id: str) -> Optional[Any]:
+        """Retorna la sesión (rehidratándola si está fría) o None si no existe"""
+        session = self._hot.get(session_id)
+        if session is not None:
+            return session
+
+        # Si otro request ya la está rehidratando, espera ese resultado
+        pending = self._rehydrating.get(session_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        cold = self._cold.get(session_id)
+        if cold is None:
+            return None
+
+        future = asyncio.get_running_loop().create_future()
+        self._rehydrating[session_id] = future
+        try:
+            start = time.perf_counter()
+            with span("session.rehydrate", blob_bytes=len(cold.blob)):
+                snapshot = json.loads(zlib.decompress(cold.blob))
+                session = await self.restore(snapshot)
+            self._record_rehydration(time.perf_counter() - start)
+
+            # Pudo haberse cerrado mientras se rehidrataba
+            if self._cold.pop(session_id, None) is not None:
+                self._hot[session_id] = session
+                self._last_active[session_id] = time.monotonic()
+            future.set_result(session)
+            return session
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Evita el warning de excepción no recuperada
+            raise
+        finally:
+            del self._rehydrating[session_id]
+
+    def put(self, session_id: str, session: Any):
+        """Registra una sesión nueva en el tier caliente"""
+        self._cold.pop(session_id, None)
+        self._hot[session_id] = session
+        self._last_active[session_id] = time.monotonic()
+
+    def remove(self, session_id: str) -> bool:
+        """Elimina una sesión de ambos tiers. Retorna False si no existía"""
+        found = self._hot.pop(session_id, None) is not None
+        found = self._cold.pop(session_id, None) is not None or found
+        self._last_active.pop(session_id, None)
+        return found
+
+    @asynccontextmanager
+    async def checkout(
+        self,
+        session_id: str,
+        create: Callable[[], Any]
+    ) -> AsyncIterator[Any]:
+        """
+        Obtiene (o crea) la sesión y la marca en uso para que no se congele
+        mientras se procesa el turno.
+        """
+        session = await self.get(session_id)
+        if session is None:
+            session = create()
+            self.put(session_id, session)
+
+        self._in_flight[session_id] = self._in_flight.get(session_id, 0) + 1
+        try:
+            yield session
+        finally:
+            self._in_flight[session_id] -= 1
+            if not self._in_flight[session_id]:
+                del self._in_flight[session_id]
+            if session_id in self._hot:
+                self._last_active[session_id] = time.monotonic()
+
+    async def freeze(self, session_id: str) -> bool:
+        """Pasa una sesión caliente al tier frío. Retorna False si no se pudo"""
+        session = self._hot.get(session_id)
+        if session is None or session_id in self._in_flight:
+            return False
+
+        snapshot = await session.to_snapshot()
+        # La sesión pudo recibir un mensaje o cerrarse durante el await
+        if self._hot.get(session_id) is not session or session_id in self._in_flight:
+            return False
+
+        raw = json.dumps(snapshot, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self._cold[session_id] = _ColdSession(
+            blob=zlib.compress(raw, self.compression_level),
+            raw_size=len(raw),
+            status=session.get_qualification_status(),
+            frozen_at=time.time()
+        )
+        del self._hot[session_id]
+        self._last_active.pop(session_id, None)
+        self.freezes += 1
+        return True
+
+    async def freeze_idle(self) -> int:
+        """Congela todas las sesiones inactivas por más de idle_seconds"""
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [sid for sid, last in self._last_active.items() if last <= cutoff]
+        frozen = 0
+        for session_id in idle:
+            if await self.freeze(session_id):
+                frozen += 1
+        return frozen
+
+    async def run_sweeper(self, interval_seconds: float = 60):
+        """Loop de fondo que congela sesiones inactivas periódicamente"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.freeze_idle()
+            except Exception:
+                logger.exception("session_sweep_failed")
+
+    def get_status(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Estado de calificación sin rehidratar sesiones frías"""
+        session = self._hot.get(session_id)
+        if session is not None:
+            return session.get_qualification_status()
+        cold = self._cold.get(session_id)
+        return cold.status if cold else None
+
+    def list_statuses(self) -> List[Dict[str, Any]]:
+        """Estado de todas las sesiones con su tier"""
+        hot = [
+            {"session_id": sid, "tier": "hot", "status": session.get_qualification_status()}
+            for sid, session in self._hot.items()
+        ]
+        cold = [
+            {"session_id": sid, "tier": "cold", "status": entry.status}
+            for sid, entry in self._cold.items()
+        ]
+        return hot + cold
+
+    def _record_rehydration(self, seconds: float):
+        self.rehydrations += 1
+        self._rehydrate_latencies.append(seconds)
+        # Ventana acotada para los percentiles
+        if len(self._rehydrate_latencies) > 1000:
+            del self._rehydrate_latencies[:500]
+
+    def memory_report(self) -> Dict[str, Any]:
+        """Memoria del tier frío y latencia de rehidratación"""
+        blob_bytes = sum(len(entry.blob) for entry in self._cold.values())
+        raw_bytes = sum(entry.raw_size for entry in self._cold.values())
+        latencies = sorted(self._rehydrate_latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 2)
+
+        return {
+            "hot_sessions": len(self._hot),
+            "cold_sessions": len(self._cold),
+            "idle_seconds": self.idle_seconds,
+            "cold_bytes_total": blob_bytes,
+            "cold_bytes_per_session": round(blob_bytes / len(self._cold)) if self._cold else 0,
+            "compression_ratio": round(raw_bytes / blob_bytes, 2) if blob_bytes else None,
+            "freezes": self.freezes,
+            "rehydrations": self.rehydrations,
+            "rehydrate_ms_p50": percentile(0.5),
+            "rehydrate_ms_p99": percentile(0.99)
+        }
@@ -0,0 +1,276 @@
+"""
+Logging estructurado (JSON) que no bloquea el request.
+
+El request solo arma el LogRecord y lo deja en una cola acotada; un hilo
+(QueueListener) lo formatea, redacta PII y lo escribe. Si la cola se llena,
+el registro se descarta y se cuenta en vez de bloquear el turno.
+
+Uso:
+    from structured_logging import get_logger, log_context
+    logger = get_logger(__name__)
+
+    with log_context(tenant_id="company_001", session_id=session_id):
+        logger.info("message_received", phone=phone, message=text, sampled=True)
+        logger.exception("turn_failed")   # Incluye el traceback
+
+Variables de entorno:
+    LOG_LEVEL             Nivel de los loggers del agente (default INFO)
+    LOG_INFO_SAMPLE_RATE  Fracción de logs info marcados sampled=True que se emiten
+    LOG_REDACT_PII        "false" para ver teléfonos y mensajes completos (solo dev)
+    LOG_QUEUE_SIZE        Registros en espera antes de empezar a descartar
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+
+ROOT_LOGGER = "inbound"
+
+# Campos con datos personales: se enmascaran
+PII_FIELDS = {"phone", "prospect_phone", "email", "name", "prospect_name"}
+# Campos "<tenant>_<teléfono>": se enmascara la parte del teléfono
+SESSION_FIELDS = {"session_id"}
+# Campos con texto de la conversación: solo se registra el largo
+CONTENT_FIELDS = {"message", "response", "text"}
+
+# Teléfonos con '+' (8+ dígitos) o sin '+' como los envía WhatsApp (9+ dígitos,
+# así fechas tipo 20250115 no se enmascaran)
+_PHONE_RE = re.compile(r"(?<!\d)(?:\+\d{8,15}|\d{9,15})(?!\d)")
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+
+_context: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+
+_info_sample_rate = 1.0
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["_DroppingQueueHandler"] = None
+
+
+def _mask_phone(value: str) -> str:
+    return f"***{value[-4:]}" if len(value) > 4 else "***"
+
+
+def _mask_email(value: str) -> str:
+    user, _, domain = value.partition("@")
+    return f"{user[:1]}***@{domain}"
+
+
+def _mask_session(value: str) -> str:
+    tenant, separator, phone = value.rpartition("_")
+    return f"{tenant}{separator}{_mask_phone(phone)}" if separator else _mask_phone(value)
+
+
+def redact_text(text: str) -> str:
+    """Enmascara teléfonos (con o sin '+') y emails dentro de texto libre"""
+    text = _PHONE_RE.sub(lambda m: _mask_phone(m.group()), text)
+    if "@" not in text:
+        return text
+    return _EMAIL_RE.sub(lambda m: _mask_email(m.group()), text)
+
+
+def redact_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia de los campos con PII enmascarada y contenido reemplazado por su largo"""
+    redacted = {}
+    for key, value in fields.items():
+        if value is None:
+            redacted[key] = None
+        elif key in CONTENT_FIELDS:
+            redacted[key] = f"<{len(str(value))} chars>"
+        elif key in SESSION_FIELDS:
+            redacted[key] = _mask_session(str(value))
+        elif key in PII_FIELDS:
+            value = str(value)
+            if "@" in value:
+                redacted[key] = _mask_email(value)
+            elif key.endswith("phone"):
+                redacted[key] = _mask_phone(value)
+            else:
+                redacted[key] = "<redacted>"
+        elif isinstance(value, str):
+            redacted[key] = redact_text(value)
+        else:
+            redacted[key] = value
+    return redacted
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea: ts, level, logger, event y campos"""
+
+    def __init__(self, redact: bool = True):
+        super().__init__()
+        self.redact = redact
+        # El listener es un solo hilo: cachea el timestamp formateado por segundo
+        self._cached_second = -1
+        self._cached_prefix = ""
+
+    def _timestamp(self, created: float) -> str:
+        second = int(created)
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        return f"{self._cached_prefix}.{int((created - second) * 1000):03d}Z"
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", None) or {}
+        event = record.getMessage()
+        exc = self.formatException(record.exc_info) if record.exc_info else None
+
+        if self.redact:
+            fields = redact_fields(fields)
+            event = redact_text(event)
+            exc = redact_text(exc) if exc else None
+
+        entry = {
+            "ts": self._timestamp(record.created),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": event,
+            **fields
+        }
+        if exc:
+            entry["exc"] = exc
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que nunca bloquea ni formatea en el hilo del request"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # La cola es en memoria: el listener formatea (y arma el traceback)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Al apagar espera lugar en la cola aunque esté llena
+        self.queue.put(self._sentinel)
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """
+    Logger con campos como kwargs: logger.info("evento", campo=valor).
+    Agrega los campos de log_context() y permite muestrear logs info
+    de alto volumen con sampled=True.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        super().__init__(logger, {})
+
+    def log(
+        self,
+        level: int,
+        msg: Any,
+        *args,
+        sampled: bool = False,
+        exc_info: Any = None,
+        **fields
+    ):
+        if not self.isEnabledFor(level):
+            return
+        if sampled and level <= logging.INFO and random.random() >= _info_sample_rate:
+            return
+
+        if exc_info:
+            if isinstance(exc_info, BaseException):
+                exc_info = (type(exc_info), exc_info, exc_info.__traceback__)
+            elif not isinstance(exc_info, tuple):
+                exc_info = sys.exc_info()
+
+        # Sin findCaller(): recorrer el stack es lo más caro de un log y el
+        # JSON no incluye archivo ni línea
+        record = self.logger.makeRecord(self.logger.name, level, "", 0, msg, args, exc_info)
+        context = _context.get()
+        record.fields = {**context, **fields} if context else fields
+        self.logger.handle(record)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    """Logger estructurado bajo la jerarquía 'inbound'"""
+    return StructuredLogger(logging.getLogger(f"{ROOT_LOGGER}.{name}"))
+
+
+@contextmanager
+def log_context(**fields):
+    """Agrega campos (tenant_id, session_id, ...) a todos los logs del bloque"""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def setup_logging(stream=None, force: bool = False):
+    """
+    Configura la cola y el listener (idempotente).
+    Los loggers del agente usan LOG_LEVEL; las librerías (ADK, uvicorn, etc.)
+    pasan por el mismo pipeline desde WARNING.
+    """
+    global _listener, _queue_handler, _info_sample_rate
+    if _listener is not None:
+        if not force:
+            return
+        shutdown_logging()
+
+    _info_sample_rate = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1.0"))
+    redact = os.getenv("LOG_REDACT_PII", "true").lower() != "false"
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter(redact=redact))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    _queue_handler = _DroppingQueueHandler(log_queue)
+    _listener = _QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [h for h in root.handlers if not isinstance(h, _DroppingQueueHandler)]
+    root.addHandler(_queue_handler)
+    if root.level == logging.NOTSET or root.level > logging.WARNING:
+        root.setLevel(logging.WARNING)
+
+    logging.getLogger(ROOT_LOGGER).setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+
+def shutdown_logging():
+    """Vacía la cola y detiene el listener"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
+
+
+def logging_metrics() -> Dict[str, Any]:
+    """Tamaño de la cola y registros descartados"""
+    if _queue_handler is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "info_sample_rate": _info_sample_rate
+    }
+
+
+atexit.register(shutdown_logging)
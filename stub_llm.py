@@ -0,0 +1,103 @@
+"""
+LLM de prueba para desarrollo local y benchmarks.
+Se activa con LLM_BACKEND=stub y no necesita API key ni red.
+"""
+import asyncio
+import os
+import random
+from typing import Any, AsyncGenerator, Dict, List
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+
+class StubLlm(BaseLlm):
+    """
+    Modelo falso compatible con ADK.
+    Responde con un eco del último mensaje después de una latencia configurable.
+    Puede inyectar llamadas lentas (stragglers) y fallos para probar deadlines,
+    hedging y el circuit breaker.
+    """
+
+    model: str = "stub"
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    slow_rate: float = 0.0
+    slow_ms: float = 0.0
+    failure_rate: float = 0.0
+    calls: int = 0
+
+    @classmethod
+    def from_env(cls) -> "StubLlm":
+        """Crea el stub leyendo las variables STUB_LLM_*"""
+        return cls(
+            latency_ms=float(os.getenv("STUB_LLM_LATENCY_MS", "0")),
+            jitter_ms=float(os.getenv("STUB_LLM_JITTER_MS", "0")),
+            slow_rate=float(os.getenv("STUB_LLM_SLOW_RATE", "0")),
+            slow_ms=float(os.getenv("STUB_LLM_SLOW_MS", "0")),
+            failure_rate=float(os.getenv("STUB_LLM_FAILURE_RATE", "0"))
+        )
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        self.calls += 1
+
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if random.random() < self.slow_rate:
+            delay += self.slow_ms
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        if random.random() < self.failure_rate:
+            raise RuntimeError("Stub LLM: fallo inyectado")
+
+        yield LlmResponse(
+            content=types.Content(
+                role="model",
+                parts=[types.Part(text=f"Recibido: {_last_user_text(llm_request)}")]
+            )
+        )
+
+
+class ScriptedLlm(StubLlm):
+    """
+    Stub que sigue un guion: cada llamada al modelo consume el siguiente paso.
+    Un paso es {"call": "<tool>", "args": {...}} (function call) o
+    {"text": "..."} (respuesta final). Con el guion agotado responde con eco.
+    Sirve para medir conversaciones con tools sin Gemini.
+    """
+
+    model: str = "scripted-stub"
+    script: List[Dict[str, Any]] = []
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if self.calls >= len(self.script):
+            async for response in super().generate_content_async(llm_request, stream):
+                yield response
+            return
+        
+        step = self.script[self.calls]
+        self.calls += 1
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        if "call" in step:
+            part = types.Part(function_call=types.FunctionCall(name=step["call"], args=step.get("args", {})))
+        else:
+            part = types.Part(text=step["text"])
+        yield LlmResponse(content=types.Content(role="model", parts=[part]))
+
+
+def _last_user_text(llm_request: LlmRequest) -> str:
+    """Texto del último mensaje del usuario en el request"""
+    for content in reversed(llm_request.contents):
+        if content.role == "user" and content.parts:
+            texts = [part.text for part in content.parts if part.text]
+            if texts:
+                return " ".join(texts)
+    return ""
@@ -0,0 +1,65 @@
+"""
+Rebuild de la analítica del funnel con registros confirmados en paralelo.
+"""
+import threading
+
+import analytics
+from analytics import FunnelAnalytics
+
+
+def _prospect(i: int, status: str = "QUALIFIED") -> dict:
+    return {
+        "id": f"prospect_{i}",
+        "tenant_id": "company_001",
+        "phone": f"+5691234500{i}",
+        "bant": {"budget": "5000 USD"},
+        "qualification_status": status,
+        "created_at": "2025-01-01T10:00:00"
+    }
+
+
+def test_records_during_rebuild_do_not_block_and_are_replayed(monkeypatch):
+    funnel = FunnelAnalytics()
+    loading = threading.Event()
+    release = threading.Event()
+
+    def slow_load():
+        loading.set()
+        assert release.wait(5)
+        # El JSON ya trae prospect_2, que también llega por record_prospect
+        return {"prospects": [_prospect(1), _prospect(2)]}
+
+    monkeypatch.setattr(analytics, "_load_mock_db", slow_load)
+    monkeypatch.setattr(analytics, "_load_mock_calendar", lambda: {"meetings": []})
+
+    rebuild = threading.Thread(target=funnel.rebuild)
+    rebuild.start()
+    assert loading.wait(5)
+
+    # Con el rebuild a medio camino, registrar no espera al rebuild
+    recorder = threading.Thread(
+        target=lambda: [funnel.record_prospect(_prospect(i, "NOT_QUALIFIED")) for i in (2, 3)]
+    )
+    recorder.start()
+    recorder.join(1)
+    assert not recorder.is_alive()
+
+    release.set()
+    rebuild.join(5)
+
+    summary = funnel.summary("company_001")
+    assert summary["prospects"] == 3
+    assert summary["by_qualification_status"] == {"QUALIFIED": 2, "NOT_QUALIFIED": 1}
+
+
+def test_rebuild_replaces_previous_aggregates(monkeypatch):
+    funnel = FunnelAnalytics()
+    monkeypatch.setattr(analytics, "_load_mock_db", lambda: {"prospects": [_prospect(1)]})
+    monkeypatch.setattr(analytics, "_load_mock_calendar", lambda: {"meetings": []})
+
+    funnel.ensure_loaded()
+    funnel.record_prospect(_prospect(2))
+    assert funnel.summary("company_001")["prospects"] == 2
+
+    assert funnel.rebuild() == {"prospects": 1, "meetings": 0}
+    assert funnel.summary("company_001")["prospects"] == 1
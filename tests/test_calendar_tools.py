@@ -0,0 +1,50 @@
+"""
+Búsqueda de horarios libres en lote (find_available_slots).
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from tools import calendar_tools
+from tools.calendar_tools import MAX_SEARCH_DAYS, MAX_SLOT_RESULTS, find_available_slots
+
+
+def _business_days(start: str, count: int) -> list:
+    day, days = date.fromisoformat(start), []
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day.isoformat())
+        day += timedelta(days=1)
+    return days
+
+
+@pytest.fixture(autouse=True)
+def calendar_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(calendar_tools, "MOCK_CALENDAR_FILE", tmp_path / "calendar_mock.json")
+
+
+def test_days_and_max_results_are_clamped():
+    result = find_available_slots(start_date="2025-01-06", days=10 ** 7, max_results=10 ** 6)
+    assert len(result["available_slots"]) == MAX_SLOT_RESULTS
+
+    # Con los primeros MAX_SEARCH_DAYS días hábiles ocupados no sigue buscando más allá
+    calendar_tools._save_mock_calendar({"meetings": [
+        {"date": day, "time": hour}
+        for day in _business_days("2025-01-06", MAX_SEARCH_DAYS)
+        for hour in calendar_tools.BUSINESS_HOURS
+    ]})
+    result = find_available_slots(start_date="2025-01-06", days=10 ** 7)
+    assert result["available_slots"] == []
+    assert len(result["unavailable_slots"]) == MAX_SEARCH_DAYS * len(calendar_tools.BUSINESS_HOURS)
+
+
+def test_search_covers_business_days_only():
+    result = find_available_slots(start_date="2025-01-10", days=2, max_results=MAX_SLOT_RESULTS)
+    # Viernes 10 y lunes 13: el fin de semana no cuenta
+    assert {slot["date"] for slot in result["available_slots"]} == {"2025-01-10", "2025-01-13"}
+    assert len(result["available_slots"]) == 2 * len(calendar_tools.BUSINESS_HOURS)
+
+
+def test_non_positive_values_still_return_a_slot():
+    result = find_available_slots(start_date="2025-01-06", days=0, max_results=0)
+    assert result["available_slots"] == [{"date": "2025-01-06", "time": "09:00"}]
@@ -0,0 +1,96 @@
+"""
+Regresiones del parser en streaming de export.py (cursores).
+"""
+import json
+
+import pytest
+
+import export
+from export import InvalidCursor, export_records, iter_json_array
+from tools import crm_tools
+
+
+PROSPECTS = [
+    {
+        "id": f"prospect_{i}",
+        "tenant_id": "company_001",
+        "name": f"Prospecto {i} ñandú",
+        "phone": f"+5691234567{i}",
+        "bant": {"budget": "5000 USD", "authority": "CEO", "need": "CRM", "timeline": "Q3"},
+        "qualification_status": "QUALIFIED",
+        "created_at": "2025-01-0%dT10:00:00" % (i + 1)
+    }
+    for i in range(5)
+]
+
+
+@pytest.fixture
+def crm_file(tmp_path, monkeypatch):
+    path = tmp_path / "crm_mock.json"
+    path.write_text(json.dumps({"prospects": PROSPECTS}, indent=2, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(crm_tools, "MOCK_DB_FILE", path)
+    return path
+
+
+def test_reads_all_records_across_small_chunks(crm_file):
+    records = [record for record, _ in iter_json_array(crm_file, "prospects", chunk_size=7)]
+    assert records == PROSPECTS
+
+
+def test_cursor_resumes_after_record(crm_file):
+    cursors = [cursor for _, cursor in iter_json_array(crm_file, "prospects")]
+    resumed = [record["id"] for record, _ in iter_json_array(crm_file, "prospects", cursors[1])]
+    assert resumed == ["prospect_2", "prospect_3", "prospect_4"]
+    assert list(iter_json_array(crm_file, "prospects", cursors[-1])) == []
+
+
+def test_cursor_before_comma_inside_record_is_rejected(crm_file):
+    # Justo antes de la ',' que separa "name" de "phone" dentro de un registro
+    raw = crm_file.read_bytes()
+    cursor = raw.rindex(b",", 0, raw.index(b'"phone"'))
+    with pytest.raises(InvalidCursor):
+        export_records("prospects", cursor=cursor)
+
+
+def test_cursor_inside_string_is_rejected(crm_file):
+    raw = crm_file.read_bytes()
+    cursor = raw.index("ñandú".encode("utf-8"))
+    with pytest.raises(InvalidCursor):
+        export_records("prospects", cursor=cursor)
+
+
+@pytest.mark.parametrize("cursor", [-1, 10 ** 9])
+def test_out_of_range_cursor_is_rejected(crm_file, cursor):
+    with pytest.raises(InvalidCursor):
+        export_records("prospects", cursor=cursor)
+
+
+def test_export_filters_and_limit(crm_file):
+    lines = list(export_records("prospects", start="2025-01-02", limit=2))
+    assert [json.loads(line)["id"] for line in lines] == ["prospect_1", "prospect_2"]
+    assert export.CSV_COLUMNS["prospects"][-1] == "_cursor"
+
+
+def test_save_during_export_keeps_reading_the_opened_version(tmp_path, monkeypatch):
+    path = tmp_path / "crm_mock.json"
+    monkeypatch.setattr(crm_tools, "MOCK_DB_FILE", path)
+    # Más grande que el buffer de lectura, para que el resto se lea del disco
+    prospects = [dict(PROSPECTS[0], id=f"prospect_{i}") for i in range(2000)]
+    crm_tools._save_mock_db({"prospects": prospects})
+
+    stream = iter_json_array(path, "prospects")
+    first, _ = next(stream)
+
+    # save_to_crm reescribe el archivo (con otro contenido) mientras el export sigue leyendo
+    crm_tools._save_mock_db({"prospects": [dict(p, name="Otro") for p in prospects]})
+
+    assert [first] + [record for record, _ in stream] == prospects
+
+
+def test_cursor_resumes_after_new_records(crm_file):
+    cursor = [cursor for _, cursor in iter_json_array(crm_file, "prospects")][-1]
+    extra = dict(PROSPECTS[0], id="prospect_5")
+    crm_tools._save_mock_db({"prospects": PROSPECTS + [extra]})
+
+    resumed = [record["id"] for record, _ in iter_json_array(crm_file, "prospects", cursor)]
+    assert resumed == ["prospect_5"]
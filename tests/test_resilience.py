@@ -0,0 +1,75 @@
+"""
+Transiciones del circuit breaker del LLM.
+"""
+import time
+
+from resilience import CircuitBreaker
+
+
+def _breaker(cooldown_seconds: float = 0.05) -> CircuitBreaker:
+    return CircuitBreaker(
+        failure_rate_threshold=0.5, min_requests=4, window_seconds=30, cooldown_seconds=cooldown_seconds
+    )
+
+
+def _fail(breaker: CircuitBreaker, times: int):
+    for _ in range(times):
+        assert breaker.allow_request()
+        breaker.record_failure()
+
+
+def test_closed_open_half_open_closed():
+    breaker = _breaker()
+
+    # Con menos de min_requests no abre aunque todo falle
+    _fail(breaker, 3)
+    assert breaker.state == "closed"
+    _fail(breaker, 1)
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    # Pasado el cooldown deja pasar una sola llamada de prueba
+    assert breaker.allow_request()
+    assert breaker.state == "half_open"
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow_request()
+    assert breaker.metrics()["times_opened"] == 1
+    assert breaker.metrics()["rejected"] == 2
+
+
+def test_failed_probe_reopens():
+    breaker = _breaker()
+    _fail(breaker, 4)
+    time.sleep(0.06)
+
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+    assert breaker.metrics()["times_opened"] == 2
+
+
+def test_abandoned_probe_frees_the_slot():
+    breaker = _breaker()
+    _fail(breaker, 4)
+    time.sleep(0.06)
+
+    assert breaker.allow_request()
+    breaker.record_abandoned()
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+
+
+def test_low_failure_rate_stays_closed():
+    breaker = _breaker()
+    for ok in (True, False, True, True, False, True):
+        assert breaker.allow_request()
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+    assert breaker.state == "closed"
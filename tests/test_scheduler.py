@@ -0,0 +1,130 @@
+"""
+Reparto justo, deadline y cancelación de turnos en TenantScheduler.
+"""
+import asyncio
+
+import pytest
+
+from config import SchedulingLimits
+from scheduler import SchedulerOverloaded, TenantScheduler
+
+
+def _scheduler(max_concurrency: int = 1, **limits) -> TenantScheduler:
+    limits = {"rate_per_second": 1000.0, "burst": 1000, **limits}
+    return TenantScheduler(max_concurrency, limits_loader=lambda tenant_id: SchedulingLimits(**limits))
+
+
+def test_backlogged_tenants_alternate():
+    async def scenario():
+        scheduler = _scheduler()
+        order = []
+
+        def turn(tenant_id):
+            async def run():
+                order.append(tenant_id)
+                await asyncio.sleep(0)
+            return run
+
+        # company_a encola todo primero; aun así no acapara el único slot
+        tasks = [asyncio.create_task(scheduler.run("company_a", turn("a"))) for _ in range(4)]
+        tasks += [asyncio.create_task(scheduler.run("company_b", turn("b"))) for _ in range(4)]
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["a", "b"] * 4
+
+
+def test_weight_splits_capacity():
+    async def scenario():
+        weights = {"company_a": 2.0, "company_b": 1.0}
+        scheduler = TenantScheduler(1, limits_loader=lambda tenant_id: SchedulingLimits(
+            rate_per_second=1000.0, burst=1000, weight=weights[tenant_id]
+        ))
+        order = []
+
+        def turn(tenant_id):
+            async def run():
+                order.append(tenant_id)
+                await asyncio.sleep(0)
+            return run
+
+        tasks = [
+            asyncio.create_task(scheduler.run(tenant_id, turn(tenant_id[-1])))
+            for tenant_id in ("company_a", "company_b")
+            for _ in range(6)
+        ]
+        await asyncio.gather(*tasks)
+        return order
+
+    # Mientras ambos tienen cola, company_a recibe dos turnos por cada uno de company_b
+    assert asyncio.run(scenario())[:9].count("a") == 6
+
+
+def test_turn_over_deadline_is_shed():
+    async def scenario():
+        scheduler = _scheduler(queue_deadline_seconds=0.05)
+        release = asyncio.Event()
+        blocker = asyncio.create_task(scheduler.run("company_a", release.wait))
+        await asyncio.sleep(0)
+
+        with pytest.raises(SchedulerOverloaded) as excinfo:
+            await scheduler.run("company_a", lambda: asyncio.sleep(0))
+
+        release.set()
+        await blocker
+        return excinfo.value, scheduler.metrics("company_a"), scheduler.running
+
+    error, metrics, running = asyncio.run(scenario())
+    assert error.reason == "deadline"
+    assert metrics["shed_deadline"] == 1
+    assert metrics["queued"] == 0
+    assert running == 0
+
+
+def test_full_queue_is_rejected_immediately():
+    async def scenario():
+        scheduler = _scheduler(max_queue_size=1)
+        release = asyncio.Event()
+        blocker = asyncio.create_task(scheduler.run("company_a", release.wait))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(scheduler.run("company_a", lambda: asyncio.sleep(0)))
+        await asyncio.sleep(0)
+
+        with pytest.raises(SchedulerOverloaded) as excinfo:
+            await scheduler.run("company_a", lambda: asyncio.sleep(0))
+
+        release.set()
+        await asyncio.gather(blocker, queued)
+        return excinfo.value.reason
+
+    assert asyncio.run(scenario()) == "queue_full"
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        scheduler = _scheduler()
+        release = asyncio.Event()
+        blocker = asyncio.create_task(scheduler.run("company_a", release.wait))
+        await asyncio.sleep(0)
+
+        started = []
+        waiting = asyncio.create_task(scheduler.run("company_a", lambda: started.append(1)))
+        await asyncio.sleep(0)
+        assert scheduler.metrics("company_a")["queued"] == 1
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        queued_after_cancel = scheduler.metrics("company_a")["queued"]
+
+        # El slot sigue siendo del turno en curso y pasa al siguiente al liberarse
+        release.set()
+        await blocker
+        result = await scheduler.run("company_a", lambda: asyncio.sleep(0, "ok"))
+        return queued_after_cancel, started, result, scheduler.running
+
+    queued, started, result, running = asyncio.run(scenario())
+    assert queued == 0
+    assert started == []
+    assert result == "ok"
+    assert running == 0
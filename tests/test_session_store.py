@@ -0,0 +1,86 @@
+"""
+Tier frío de sesiones: congelar y rehidratar sin perder el historial ADK.
+"""
+import asyncio
+import os
+
+# El agente usa el LLM de prueba (sin API key, eco inmediato y sin fallos)
+os.environ["LLM_BACKEND"] = "stub"
+for name in ("STUB_LLM_LATENCY_MS", "STUB_LLM_JITTER_MS", "STUB_LLM_SLOW_RATE", "STUB_LLM_FAILURE_RATE"):
+    os.environ[name] = "0"
+
+from agent import InboundAgentSession  # noqa: E402
+from session_store import SessionStore  # noqa: E402
+
+
+PHONE = "+56912345678"
+
+
+async def _history(session: InboundAgentSession) -> list:
+    adk_session = await session.session_service.get_session(
+        app_name="inbound_bant_agent", user_id=session.user_id, session_id=session.session_id
+    )
+    return [
+        (event.author, event.content.parts[0].text)
+        for event in adk_session.events
+        if event.content and event.content.parts
+    ]
+
+
+def test_freeze_and_rehydrate_keeps_history_and_state():
+    async def scenario():
+        store = SessionStore(restore=InboundAgentSession.from_snapshot, idle_seconds=0)
+        async with store.checkout("s1", lambda: InboundAgentSession("company_001", PHONE)) as session:
+            session.prospect_context = "Prospecto nuevo: no hay registros en el CRM."
+            await session.send_message_async("Hola, necesito un CRM")
+            await session.send_message_async("Somos 20 vendedores")
+            session.bant_data["need"] = "CRM"
+        before = await _history(session)
+
+        assert await store.freeze_idle() == 1
+        report = store.memory_report()
+        assert (report["hot_sessions"], report["cold_sessions"]) == (0, 1)
+        assert store.get_status("s1")["bant_data"]["need"] == "CRM"
+
+        restored = await store.get("s1")
+        assert restored is not session
+        after = await _history(restored)
+
+        # La sesión rehidratada sigue la conversación sobre el mismo historial
+        reply = await restored.send_message_async("¿Qué sigue?")
+        return before, after, restored, reply, await _history(restored), store.memory_report()
+
+    before, after, restored, reply, extended, report = asyncio.run(scenario())
+    assert len(before) == 4
+    assert after == before
+    assert restored.bant_data["need"] == "CRM"
+    assert restored.prospect_context == "Prospecto nuevo: no hay registros en el CRM."
+    assert restored.tenant_id == "company_001"
+    assert reply == "Recibido: ¿Qué sigue?"
+    assert extended[:4] == before and len(extended) == 6
+    assert (report["hot_sessions"], report["cold_sessions"], report["rehydrations"]) == (1, 0, 1)
+
+
+def test_session_in_use_is_not_frozen_and_concurrent_gets_rehydrate_once():
+    async def scenario():
+        restores = []
+
+        async def restore(snapshot):
+            restores.append(snapshot["prospect_phone"])
+            await asyncio.sleep(0.01)
+            return await InboundAgentSession.from_snapshot(snapshot)
+
+        store = SessionStore(restore=restore, idle_seconds=0)
+        async with store.checkout("s1", lambda: InboundAgentSession("company_001", PHONE)) as session:
+            await session.send_message_async("Hola")
+            frozen_in_use = await store.freeze("s1")
+        frozen_idle = await store.freeze("s1")
+
+        first, second = await asyncio.gather(store.get("s1"), store.get("s1"))
+        return frozen_in_use, frozen_idle, first is second, restores
+
+    frozen_in_use, frozen_idle, same, restores = asyncio.run(scenario())
+    assert frozen_in_use is False
+    assert frozen_idle is True
+    assert same
+    assert restores == [PHONE]
@@ -0,0 +1,126 @@
+"""
+Recuperación, borrado, compactación y lock del archivo de transcripciones.
+"""
+import pytest
+
+from transcripts import INDEX_FILE, ArchiveLocked, TranscriptArchive, _ENTRY, _segment_name
+
+
+TENANT = "company_001"
+ANA = "+56911111111"
+LUIS = "+56922222222"
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = TranscriptArchive(tmp_path)
+    yield archive
+    archive.close()
+
+
+def _reopen(archive: TranscriptArchive, **kwargs) -> TranscriptArchive:
+    archive.close()
+    return TranscriptArchive(archive.directory, **kwargs)
+
+
+def _messages(archive: TranscriptArchive, phone: str) -> list:
+    return [turn["message"] for turn in archive.iter_history(TENANT, phone)]
+
+
+def _append(archive: TranscriptArchive, phone: str, *messages: str):
+    for message in messages:
+        archive.append(TENANT, phone, f"{TENANT}_{phone}", message, f"Respuesta a {message}")
+
+
+def test_lost_index_tail_is_recovered_on_open(archive):
+    _append(archive, ANA, "hola", "somos 20", "¿precio?")
+    archive.close()
+
+    # Muere con solo la primera entrada del índice escrita (y otra a medias)
+    index = archive.directory / INDEX_FILE
+    index.write_bytes(index.read_bytes()[:_ENTRY.size + 10])
+
+    reopened = TranscriptArchive(archive.directory)
+    try:
+        assert _messages(reopened, ANA) == ["hola", "somos 20", "¿precio?"]
+        assert reopened.recovered == 2
+        assert index.stat().st_size == 3 * _ENTRY.size
+    finally:
+        reopened.close()
+
+
+def test_partial_line_is_truncated_and_appends_continue(archive):
+    _append(archive, ANA, "hola", "somos 20")
+    archive.close()
+
+    segment = archive.directory / _segment_name(1)
+    size = segment.stat().st_size
+    with open(segment, "ab") as f:
+        f.write(b'{"tenant_id": "company_001", "phone": "+569111')
+
+    reopened = TranscriptArchive(archive.directory)
+    try:
+        _append(reopened, ANA, "¿precio?")
+        assert _messages(reopened, ANA) == ["hola", "somos 20", "¿precio?"]
+        assert segment.read_bytes().count(b"\n") == 3
+        assert segment.stat().st_size > size
+    finally:
+        reopened.close()
+
+
+def test_erase_survives_restart(archive):
+    _append(archive, ANA, "hola", "somos 20")
+    _append(archive, LUIS, "buenas")
+    assert archive.erase(TENANT, ANA) == 2
+    assert archive.history(TENANT, ANA)["total"] == 0
+
+    reopened = _reopen(archive)
+    try:
+        assert _messages(reopened, ANA) == []
+        assert _messages(reopened, LUIS) == ["buenas"]
+
+        # Lo que escribe después del borrado sí queda
+        _append(reopened, ANA, "volví")
+        reopened = _reopen(reopened)
+        assert _messages(reopened, ANA) == ["volví"]
+    finally:
+        reopened.close()
+
+
+def test_compaction_drops_erased_turns_and_keeps_history(archive):
+    archive = _reopen(archive, segment_max_bytes=400)
+    try:
+        for i in range(10):
+            _append(archive, ANA, f"ana {i}")
+            _append(archive, LUIS, f"luis {i}")
+        archive.erase(TENANT, LUIS)
+
+        result = archive.compact()
+        assert result["turns_kept"] == 10
+        assert result["segments_after"] < result["segments_before"]
+        assert result["bytes_after"] < result["bytes_before"]
+        assert _messages(archive, ANA) == [f"ana {i}" for i in range(10)]
+
+        # Sigue escribiendo sobre el archivo compactado, y todo sobrevive al reinicio
+        _append(archive, LUIS, "luis nuevo")
+        archive = _reopen(archive, segment_max_bytes=400)
+        assert _messages(archive, ANA) == [f"ana {i}" for i in range(10)]
+        assert _messages(archive, LUIS) == ["luis nuevo"]
+        assert not list(archive.directory.glob("*.compact"))
+    finally:
+        archive.close()
+
+
+def test_second_process_cannot_open_the_archive(archive):
+    _append(archive, ANA, "hola")
+
+    other = TranscriptArchive(archive.directory)
+    with pytest.raises(ArchiveLocked):
+        other.open()
+
+    archive.close()
+    other.open()
+    try:
+        assert _messages(other, ANA) == ["hola"]
+    finally:
+        other.close()
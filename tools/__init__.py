@@ -2,11 +2,18 @@
 Herramientas del agente inbound.
 """
 from .crm_tools import save_to_crm, get_prospect_info
-from .calendar_tools import schedule_meeting, check_availability
+from .calendar_tools import (
+    schedule_meeting,
+    check_availability,
+    find_available_slots,
+    book_first_available
+)
 
 __all__ = [
     'save_to_crm',
     'get_prospect_info',
     'schedule_meeting',
-    'check_availability'
+    'check_availability',
+    'find_available_slots',
+    'book_first_available'
 ]
\ No newline at end of file
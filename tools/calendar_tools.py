@@ -3,32 +3,67 @@ Herramientas de calendario (Google Calendar mock).
 En producción, esto se conectará a Google Calendar API.
 """
 import json
+import threading
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 
+from profiling import span
+from structured_logging import get_logger
+from .context import get_tenant_id
+from .storage import write_text_atomic
+
 
 # Archivo mock para simular calendario
 MOCK_CALENDAR_FILE = Path(__file__).parent.parent / "data" / "calendar_mock.json"
 
+logger = get_logger(__name__)
+
+# Horarios que se ofrecen cuando no se indican candidatos
+BUSINESS_HOURS = ["09:00", "10:00", "11:00", "12:00", "14:00", "15:00", "16:00", "17:00"]
+
+# Topes para find_available_slots: el modelo elige days y max_results y la
+# tool corre en el event loop
+MAX_SEARCH_DAYS = 30
+MAX_SLOT_RESULTS = 20
+
+# Sin tool_thread_pool_config ADK corre las tools sync en el event loop, pero
+# con un thread pool (o desde hilos propios) pueden correr en paralelo:
+# serializa leer-verificar-escribir para que dos prospectos no tomen el mismo
+# horario
+_booking_lock = threading.Lock()
+
 
 def _ensure_data_dir():
     """Crea el directorio de datos si no existe"""
     MOCK_CALENDAR_FILE.parent.mkdir(parents=True, exist_ok=True)
     if not MOCK_CALENDAR_FILE.exists():
-        MOCK_CALENDAR_FILE.write_text(json.dumps({"meetings": []}, indent=2))
+        write_text_atomic(MOCK_CALENDAR_FILE, json.dumps({"meetings": []}, indent=2))
 
 
 def _load_mock_calendar() -> Dict[str, Any]:
     """Carga el calendario mock"""
     _ensure_data_dir()
-    return json.loads(MOCK_CALENDAR_FILE.read_text())
+    with span("storage.load", file=MOCK_CALENDAR_FILE.name):
+        return json.loads(MOCK_CALENDAR_FILE.read_text())
 
 
 def _save_mock_calendar(data: Dict[str, Any]):
     """Guarda el calendario mock"""
     _ensure_data_dir()
-    MOCK_CALENDAR_FILE.write_text(json.dumps(data, indent=2, ensure_ascii=False))
+    with span("storage.save", file=MOCK_CALENDAR_FILE.name):
+        write_text_atomic(MOCK_CALENDAR_FILE, json.dumps(data, indent=2, ensure_ascii=False))
+
+
+def _busy_slots(calendar: Dict[str, Any]) -> set:
+    """Horarios ocupados como (fecha, hora) para verificar muchos candidatos de una vez"""
+    return {(meeting["date"], meeting["time"]) for meeting in calendar["meetings"]}
+
+
+def _parse_slot(slot: str) -> tuple:
+    """'YYYY-MM-DD HH:MM' → (fecha, hora), validando el formato"""
+    parsed = datetime.strptime(slot.strip(), "%Y-%m-%d %H:%M")
+    return parsed.strftime("%Y-%m-%d"), parsed.strftime("%H:%M")
 
 
 def check_availability(date: str, time: str) -> Dict[str, Any]:
@@ -74,7 +109,8 @@ def schedule_meeting(
     date: str,
     time: str,
     duration_minutes: int = 30,
-    meeting_type: str = "Llamada de descubrimiento"
+    meeting_type: str = "Llamada de descubrimiento",
+    tool_context=None
 ) -> Dict[str, Any]:
     """
     Agenda una reunión en el calendario.
@@ -87,44 +123,177 @@ def schedule_meeting(
         time: Hora en formato HH:MM
         duration_minutes: Duración en minutos
         meeting_type: Tipo de reunión
+        tool_context: Contexto de ADK (inyectado automáticamente)
     
     Returns:
         Dict con resultado de la operación
     """
     try:
-        # Verifica disponibilidad primero
-        availability = check_availability(date, time)
-        if not availability["available"]:
-            return {
-                "success": False,
-                "message": availability["message"],
-                "suggested_times": availability.get("suggested_times", [])
+        with _booking_lock:
+            calendar = _load_mock_calendar()
+            
+            # Verifica disponibilidad con el mismo calendario que se va a escribir
+            if (date, time) in _busy_slots(calendar):
+                return {
+                    "success": False,
+                    "message": f"Ya hay una reunión agendada el {date} a las {time}",
+                    "suggested_times": _get_available_slots(date)
+                }
+            
+            meeting = _book(
+                calendar, prospect_name, prospect_phone, prospect_email,
+                date, time, duration_minutes, meeting_type, tool_context
+            )
+        
+        return {
+            "success": True,
+            "meeting_id": meeting["id"],
+            "meeting_link": meeting["meeting_link"],
+            "message": f"Reunión agendada exitosamente para el {date} a las {time}",
+            "details": {
+                "date": date,
+                "time": time,
+                "duration": f"{duration_minutes} minutos",
+                "type": meeting_type
             }
+        }
         
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Error al agendar reunión"
+        }
+
+
+def find_available_slots(
+    candidate_slots: Optional[List[str]] = None,
+    start_date: Optional[str] = None,
+    days: int = 5,
+    max_results: int = 6
+) -> Dict[str, Any]:
+    """
+    Verifica muchos horarios en una sola llamada.
+    
+    Úsala en vez de llamar check_availability horario por horario:
+    - Con candidate_slots verifica exactamente esos horarios.
+    - Sin candidate_slots busca horarios libres en horario hábil desde
+      start_date (o mañana) durante `days` días hábiles.
+    
+    Args:
+        candidate_slots: Horarios a verificar, formato "YYYY-MM-DD HH:MM"
+        start_date: Fecha inicial YYYY-MM-DD para buscar horarios libres
+        days: Días hábiles a revisar desde start_date (máximo 30)
+        max_results: Máximo de horarios libres a retornar (máximo 20)
+    
+    Returns:
+        Dict con available_slots y unavailable_slots ({"date", "time"})
+    """
+    try:
+        days = min(max(int(days), 1), MAX_SEARCH_DAYS)
+        max_results = min(max(int(max_results), 1), MAX_SLOT_RESULTS)
         calendar = _load_mock_calendar()
+        busy = _busy_slots(calendar)
         
-        meeting = {
-            "id": f"meeting_{len(calendar['meetings']) + 1}",
-            "prospect_name": prospect_name,
-            "prospect_phone": prospect_phone,
-            "prospect_email": prospect_email,
-            "date": date,
-            "time": time,
-            "duration_minutes": duration_minutes,
-            "meeting_type": meeting_type,
-            "status": "scheduled",
-            "created_at": datetime.now().isoformat(),
-            "meeting_link": f"https://meet.google.com/mock-{len(calendar['meetings']) + 1}"  # Mock link
+        if candidate_slots:
+            candidates = [_parse_slot(slot) for slot in candidate_slots]
+        else:
+            day = (
+                datetime.strptime(start_date, "%Y-%m-%d").date()
+                if start_date else datetime.now().date() + timedelta(days=1)
+            )
+            candidates = []
+            business_days = 0
+            while business_days < days:
+                if day.weekday() < 5:
+                    candidates.extend((day.isoformat(), hour) for hour in BUSINESS_HOURS)
+                    business_days += 1
+                day += timedelta(days=1)
+        
+        available, unavailable = [], []
+        for date, time in candidates:
+            slot = {"date": date, "time": time}
+            if (date, time) in busy:
+                unavailable.append(slot)
+            elif len(available) < max_results:
+                available.append(slot)
+        
+        return {
+            "available_slots": available,
+            "unavailable_slots": unavailable,
+            "message": f"{len(available)} horarios disponibles"
         }
         
-        calendar["meetings"].append(meeting)
-        _save_mock_calendar(calendar)
+    except Exception as e:
+        return {
+            "available_slots": [],
+            "unavailable_slots": [],
+            "error": str(e),
+            "message": "Error verificando disponibilidad"
+        }
+
+
+def book_first_available(
+    prospect_name: str,
+    prospect_phone: str,
+    prospect_email: str,
+    candidate_slots: List[str],
+    duration_minutes: int = 30,
+    meeting_type: str = "Llamada de descubrimiento",
+    tool_context=None
+) -> Dict[str, Any]:
+    """
+    Agenda la reunión en el primer horario libre de la lista (verifica y agenda
+    en un solo paso, sin llamar antes a check_availability).
+    
+    Args:
+        prospect_name: Nombre del prospecto
+        prospect_phone: Teléfono del prospecto
+        prospect_email: Email del prospecto
+        candidate_slots: Horarios aceptados por el prospecto en orden de
+            preferencia, formato "YYYY-MM-DD HH:MM"
+        duration_minutes: Duración en minutos
+        meeting_type: Tipo de reunión
+        tool_context: Contexto de ADK (inyectado automáticamente)
+    
+    Returns:
+        Dict con la reunión agendada, o los horarios sugeridos si ninguno estaba libre
+    """
+    try:
+        candidates = [_parse_slot(slot) for slot in candidate_slots]
+        
+        with _booking_lock:
+            calendar = _load_mock_calendar()
+            busy = _busy_slots(calendar)
+            free = next((slot for slot in candidates if slot not in busy), None)
+            
+            if free is None:
+                dates = sorted({date for date, _ in candidates})
+                return {
+                    "success": False,
+                    "message": "Ninguno de los horarios propuestos está disponible",
+                    "suggested_slots": [
+                        {"date": date, "time": time}
+                        for date in dates
+                        for time in BUSINESS_HOURS
+                        if (date, time) not in busy
+                    ][:6]
+                }
+            
+            date, time = free
+            meeting = _book(
+                calendar, prospect_name, prospect_phone, prospect_email,
+                date, time, duration_minutes, meeting_type, tool_context
+            )
         
         return {
             "success": True,
             "meeting_id": meeting["id"],
             "meeting_link": meeting["meeting_link"],
             "message": f"Reunión agendada exitosamente para el {date} a las {time}",
+            "skipped_slots": [
+                {"date": d, "time": t} for d, t in candidates[:candidates.index(free)]
+            ],
             "details": {
                 "date": date,
                 "time": time,
@@ -141,6 +310,43 @@ def schedule_meeting(
         }
 
 
+def _book(
+    calendar: Dict[str, Any],
+    prospect_name: str,
+    prospect_phone: str,
+    prospect_email: str,
+    date: str,
+    time: str,
+    duration_minutes: int,
+    meeting_type: str,
+    tool_context
+) -> Dict[str, Any]:
+    """Agrega la reunión al calendario ya cargado y lo guarda (llamar con _booking_lock)"""
+    meeting = {
+        "id": f"meeting_{len(calendar['meetings']) + 1}",
+        "tenant_id": get_tenant_id(tool_context),
+        "prospect_name": prospect_name,
+        "prospect_phone": prospect_phone,
+        "prospect_email": prospect_email,
+        "date": date,
+        "time": time,
+        "duration_minutes": duration_minutes,
+        "meeting_type": meeting_type,
+        "status": "scheduled",
+        "created_at": datetime.now().isoformat(),
+        "meeting_link": f"https://meet.google.com/mock-{len(calendar['meetings']) + 1}"  # Mock link
+    }
+    
+    calendar["meetings"].append(meeting)
+    _save_mock_calendar(calendar)
+    
+    # Actualiza los agregados del funnel de forma incremental
+    from analytics import funnel_analytics
+    funnel_analytics.record_meeting(meeting)
+    
+    return meeting
+
+
 def _get_available_slots(date: str, num_slots: int = 3) -> List[str]:
     """
     Genera horarios disponibles sugeridos.
@@ -174,6 +380,6 @@ def get_upcoming_meetings(days_ahead: int = 7) -> List[Dict[str, Any]]:
         
         return upcoming
         
-    except Exception as e:
-        print(f"Error obteniendo reuniones: {e}")
+    except Exception:
+        logger.exception("meetings_lookup_failed")
         return []
\ No newline at end of file
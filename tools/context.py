@@ -0,0 +1,12 @@
+"""
+Utilidades para leer el contexto de la sesión desde las tools.
+ADK inyecta `tool_context` en las tools que declaran ese parámetro.
+"""
+from typing import Any, Optional
+
+
+def get_tenant_id(tool_context: Optional[Any] = None) -> str:
+    """Obtiene el tenant de la sesión actual ("default" si no hay contexto)"""
+    if tool_context is None:
+        return "default"
+    return tool_context.state.get("tenant_id") or "default"
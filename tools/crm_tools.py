@@ -3,32 +3,48 @@ Herramientas de integración con CRM (MongoDB mock).
 En producción, esto se conectará al CRM real.
 """
 import json
+import threading
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Any, Optional
 
+from profiling import span
+from structured_logging import get_logger
+from .context import get_tenant_id
+from .storage import write_text_atomic
+
 
 # Archivo mock para simular BD
 MOCK_DB_FILE = Path(__file__).parent.parent / "data" / "crm_mock.json"
 
+logger = get_logger(__name__)
+
+# Sin tool_thread_pool_config ADK corre las tools sync en el event loop, pero
+# con un thread pool (o desde hilos propios) pueden correr en paralelo:
+# serializa leer-agregar-guardar para no perder registros y para que la
+# analítica los reciba en orden de id
+_crm_lock = threading.Lock()
+
 
 def _ensure_data_dir():
     """Crea el directorio de datos si no existe"""
     MOCK_DB_FILE.parent.mkdir(parents=True, exist_ok=True)
     if not MOCK_DB_FILE.exists():
-        MOCK_DB_FILE.write_text(json.dumps({"prospects": []}, indent=2))
+        write_text_atomic(MOCK_DB_FILE, json.dumps({"prospects": []}, indent=2))
 
 
 def _load_mock_db() -> Dict[str, Any]:
     """Carga la BD mock"""
     _ensure_data_dir()
-    return json.loads(MOCK_DB_FILE.read_text())
+    with span("storage.load", file=MOCK_DB_FILE.name):
+        return json.loads(MOCK_DB_FILE.read_text())
 
 
 def _save_mock_db(data: Dict[str, Any]):
     """Guarda la BD mock"""
     _ensure_data_dir()
-    MOCK_DB_FILE.write_text(json.dumps(data, indent=2, ensure_ascii=False))
+    with span("storage.save", file=MOCK_DB_FILE.name):
+        write_text_atomic(MOCK_DB_FILE, json.dumps(data, indent=2, ensure_ascii=False))
 
 
 def save_to_crm(
@@ -40,7 +56,8 @@ def save_to_crm(
     need: str,
     timeline: str,
     qualification_status: str,
-    notes: Optional[str] = None
+    notes: Optional[str] = None,
+    tool_context=None
 ) -> Dict[str, Any]:
     """
     Guarda información del prospecto calificado en el CRM.
@@ -55,39 +72,17 @@ def save_to_crm(
         timeline: Timeline para implementación
         qualification_status: "QUALIFIED" o "NOT_QUALIFIED"
         notes: Notas adicionales
+        tool_context: Contexto de ADK (inyectado automáticamente)
     
     Returns:
         Dict con resultado de la operación
     """
     try:
-        db = _load_mock_db()
-        
-        prospect = {
-            "id": f"prospect_{len(db['prospects']) + 1}",
-            "name": name,
-            "phone": phone,
-            "email": email,
-            "bant": {
-                "budget": budget,
-                "authority": authority,
-                "need": need,
-                "timeline": timeline
-            },
-            "qualification_status": qualification_status,
-            "notes": notes or "",
-            "created_at": datetime.now().isoformat(),
-            "source": "whatsapp_inbound"
-        }
-        
-        db["prospects"].append(prospect)
-        _save_mock_db(db)
-        
-        return {
-            "success": True,
-            "prospect_id": prospect["id"],
-            "message": f"Prospecto {name} guardado exitosamente en CRM"
-        }
-        
+        with _crm_lock:
+            return _save_prospect(
+                name, phone, email, budget, authority, need, timeline,
+                qualification_status, notes, get_tenant_id(tool_context)
+            )
     except Exception as e:
         return {
             "success": False,
@@ -96,6 +91,53 @@ def save_to_crm(
         }
 
 
+def _save_prospect(
+    name: str,
+    phone: str,
+    email: str,
+    budget: str,
+    authority: str,
+    need: str,
+    timeline: str,
+    qualification_status: str,
+    notes: Optional[str],
+    tenant_id: str
+) -> Dict[str, Any]:
+    """Agrega el prospecto al CRM y a la analítica (llamar con _crm_lock)"""
+    db = _load_mock_db()
+    
+    prospect = {
+        "id": f"prospect_{len(db['prospects']) + 1}",
+        "tenant_id": tenant_id,
+        "name": name,
+        "phone": phone,
+        "email": email,
+        "bant": {
+            "budget": budget,
+            "authority": authority,
+            "need": need,
+            "timeline": timeline
+        },
+        "qualification_status": qualification_status,
+        "notes": notes or "",
+        "created_at": datetime.now().isoformat(),
+        "source": "whatsapp_inbound"
+    }
+    
+    db["prospects"].append(prospect)
+    _save_mock_db(db)
+    
+    # Actualiza los agregados del funnel de forma incremental
+    from analytics import funnel_analytics
+    funnel_analytics.record_prospect(prospect)
+    
+    return {
+        "success": True,
+        "prospect_id": prospect["id"],
+        "message": f"Prospecto {name} guardado exitosamente en CRM"
+    }
+
+
 def get_prospect_info(phone: str) -> Optional[Dict[str, Any]]:
     """
     Busca información de un prospecto por teléfono.
@@ -116,6 +158,6 @@ def get_prospect_info(phone: str) -> Optional[Dict[str, Any]]:
         
         return None
         
-    except Exception as e:
-        print(f"Error buscando prospecto: {e}")
+    except Exception:
+        logger.exception("prospect_lookup_failed")
         return None
\ No newline at end of file
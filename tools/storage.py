@@ -0,0 +1,29 @@
+"""
+Escritura de los JSON mock.
+"""
+import os
+import stat
+import tempfile
+from pathlib import Path
+
+
+def write_text_atomic(path: Path, text: str):
+    """
+    Reemplaza el archivo de una vez: escribe un temporal en el mismo
+    directorio y lo renombra encima. Un lector que ya tenía el archivo
+    abierto (p.ej. un export en curso) sigue leyendo la versión anterior
+    completa en vez de un archivo truncado a medio escribir.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        # mkstemp crea el archivo con 0600: conserva los permisos del original
+        os.chmod(tmp, stat.S_IMODE(path.stat().st_mode) if path.exists() else 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,625 @@
+"""
+Archivo append-only de transcripciones.
+Cada turno del webhook (mensaje del prospecto + respuesta del agente) se
+agrega como una línea JSON al segmento activo de data/transcripts/. Al pasar
+TRANSCRIPT_SEGMENT_MAX_BYTES el segmento se sella y se abre uno nuevo.
+
+Un índice compacto (index.bin, 32 bytes por turno) guarda por cada
+(tenant, teléfono) el segmento, offset y largo de sus turnos. En memoria son
+dos arrays por prospecto (12 bytes por turno), así leer el historial de un
+prospecto es un lookup en un dict y un slice de un mmap por turno: no depende
+de cuántos turnos tenga el archivo y no carga los segmentos en memoria.
+
+Uso:
+    python transcripts.py stats
+    python transcripts.py show company_001 +56912345678 [--limit 20]
+    python transcripts.py erase company_001 +56912345678
+    python transcripts.py compact [--keep-days 365]
+
+Un solo proceso puede tener abierto el archivo (lock exclusivo en
+archive.lock): con el servidor corriendo el CLI falla de inmediato y el
+borrado y la compactación se hacen con los endpoints admin
+(DELETE /transcripts/{tenant}/{phone}, POST /admin/transcripts/compact).
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from profiling import span
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+TRANSCRIPTS_DIR = Path(__file__).parent / "data" / "transcripts"
+
+INDEX_FILE = "index.bin"
+LOCK_FILE = "archive.lock"
+MANIFEST_FILE = "compaction.json"
+COMPACT_SUFFIX = ".compact"
+
+# key (blake2b 16 bytes), segmento, offset, largo
+_ENTRY = struct.Struct("<16sIQI")
+# Segmento reservado: borra los turnos anteriores de la key
+_TOMBSTONE = 0xFFFFFFFF
+
+# Posición empaquetada en un uint64: segmento (24 bits) | offset (40 bits)
+_OFFSET_BITS = 40
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+
+# Segmentos mapeados a la vez (cada mmap retiene un descriptor)
+MAX_OPEN_MAPS = 64
+
+
+class ArchiveLocked(RuntimeError):
+    """Otro proceso (p.ej. el servidor) tiene abierto el archivo de transcripciones"""
+
+
+def _try_lock(fd: int) -> bool:
+    """Lock exclusivo sin esperar; se libera al cerrar el descriptor"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _key(tenant_id: str, phone: str) -> bytes:
+    return hashlib.blake2b(f"{tenant_id}\x00{phone}".encode("utf-8"), digest_size=16).digest()
+
+
+def _segment_name(segment_id: int) -> str:
+    return f"segment_{segment_id:06d}.log"
+
+
+def _segment_id(path: Path) -> Optional[int]:
+    try:
+        return int(path.name[len("segment_"):-len(".log")])
+    except ValueError:
+        return None
+
+
+class _Entries:
+    """Turnos de un prospecto: posiciones empaquetadas y largos"""
+
+    __slots__ = ("positions", "lengths")
+
+    def __init__(self):
+        self.positions = array("Q")
+        self.lengths = array("I")
+
+    def add(self, segment_id: int, offset: int, length: int):
+        self.positions.append((segment_id << _OFFSET_BITS) | offset)
+        self.lengths.append(length)
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def get(self, i: int) -> Tuple[int, int, int]:
+        position = self.positions[i]
+        return position >> _OFFSET_BITS, position & _OFFSET_MASK, self.lengths[i]
+
+
+class TranscriptArchive:
+    """
+    Segmentos NDJSON append-only + índice de offsets por (tenant, teléfono).
+
+    Escribe primero el turno en el segmento y después su entrada en el
+    índice: si el proceso muere entre ambos, al abrir se re-indexa la cola
+    del segmento activo.
+    """
+
+    def __init__(
+        self,
+        directory: Path = TRANSCRIPTS_DIR,
+        segment_max_bytes: int = 64 * 1024 * 1024,
+        fsync: bool = False,
+        enabled: bool = True
+    ):
+        self.directory = Path(directory)
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self.enabled = enabled
+
+        self._lock = threading.RLock()
+        self._index: Dict[bytes, _Entries] = {}
+        self._maps: "OrderedDict[int, mmap.mmap]" = OrderedDict()
+        self._opened = False
+        self._active_id = 1
+        self._active = None
+        self._active_size = 0
+        self._index_out = None
+        self._lock_fd: Optional[int] = None
+
+        self.appended = 0
+        self.rotations = 0
+        self.recovered = 0
+
+    @classmethod
+    def from_env(cls) -> "TranscriptArchive":
+        return cls(
+            segment_max_bytes=int(os.getenv("TRANSCRIPT_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024))),
+            fsync=os.getenv("TRANSCRIPT_FSYNC", "false").lower() == "true",
+            enabled=os.getenv("TRANSCRIPTS_ENABLED", "true").lower() != "false"
+        )
+
+    # ------------------------------------------------------------------ apertura
+
+    def open(self):
+        """
+        Carga el índice y abre el segmento activo (idempotente).
+
+        Raises:
+            ArchiveLocked: Si otro proceso ya tiene abierto el directorio
+        """
+        with self._lock:
+            if self._opened:
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # La recuperación de cola, erase y compact reescriben archivos que
+            # otro proceso tendría abiertos con su propio índice en memoria
+            lock_fd = os.open(self.directory / LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+            if not _try_lock(lock_fd):
+                os.close(lock_fd)
+                raise ArchiveLocked(
+                    f"{self.directory} está abierto por otro proceso (¿el servidor?): "
+                    "usa los endpoints admin o detén el servidor"
+                )
+            self._lock_fd = lock_fd
+
+            try:
+                self._finish_compaction()
+
+                segments = self._segment_ids()
+                self._active_id = segments[-1] if segments else 1
+                indexed_end = self._load_index()
+                self._recover_tail(indexed_end)
+
+                self._active = open(self.directory / _segment_name(self._active_id), "ab")
+                self._active_size = self._active.tell()
+                self._index_out = open(self.directory / INDEX_FILE, "ab")
+            except BaseException:
+                self._release_lock()
+                raise
+            self._opened = True
+
+    def close(self):
+        with self._lock:
+            if not self._opened:
+                return
+            self._active.close()
+            self._index_out.close()
+            self._close_maps()
+            self._release_lock()
+            self._opened = False
+
+    def _release_lock(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _segment_ids(self) -> List[int]:
+        ids = (_segment_id(path) for path in self.directory.glob("segment_*.log"))
+        return sorted(segment_id for segment_id in ids if segment_id is not None)
+
+    def _load_index(self) -> int:
+        """Lee index.bin a memoria. Retorna hasta dónde está indexado el segmento activo."""
+        self._index = {}
+        path = self.directory / INDEX_FILE
+        if not path.exists():
+            return 0
+
+        # Una entrada a medio escribir al final se descarta
+        size = path.stat().st_size
+        if size % _ENTRY.size:
+            size -= size % _ENTRY.size
+            os.truncate(path, size)
+
+        index = self._index
+        active_id, indexed_end = self._active_id, 0
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(_ENTRY.size * 8192)
+                if not chunk:
+                    break
+                for key, segment_id, offset, length in _ENTRY.iter_unpack(chunk):
+                    if segment_id == _TOMBSTONE:
+                        index.pop(key, None)
+                        continue
+                    entries = index.get(key)
+                    if entries is None:
+                        entries = index[key] = _Entries()
+                    entries.positions.append((segment_id << _OFFSET_BITS) | offset)
+                    entries.lengths.append(length)
+                    if segment_id == active_id:
+                        indexed_end = max(indexed_end, offset + length + 1)
+        return indexed_end
+
+    def _recover_tail(self, indexed_end: int):
+        """Indexa los turnos del segmento activo escritos después de la última entrada del índice"""
+        path = self.directory / _segment_name(self._active_id)
+        if not path.exists() or path.stat().st_size <= indexed_end:
+            return
+
+        with open(path, "rb") as f:
+            f.seek(indexed_end)
+            tail = f.read()
+
+        # Una línea sin '\n' quedó a medio escribir: se descarta
+        complete = tail.rfind(b"\n") + 1
+        if complete < len(tail):
+            os.truncate(path, indexed_end + complete)
+
+        with open(self.directory / INDEX_FILE, "ab") as index_out:
+            offset = indexed_end
+            for line in tail[:complete].splitlines(keepends=True):
+                try:
+                    record = json.loads(line)
+                    key = _key(record["tenant_id"], record["phone"])
+                except (ValueError, KeyError, TypeError):
+                    offset += len(line)
+                    continue
+                length = len(line) - 1
+                index_out.write(_ENTRY.pack(key, self._active_id, offset, length))
+                self._index.setdefault(key, _Entries()).add(self._active_id, offset, length)
+                offset += len(line)
+                self.recovered += 1
+
+    # ------------------------------------------------------------------ escritura
+
+    def append(
+        self,
+        tenant_id: str,
+        phone: str,
+        session_id: str,
+        message: str,
+        response: str,
+        tool_calls: Optional[List[str]] = None,
+        latency_ms: Optional[float] = None
+    ):
+        """Agrega un turno al archivo"""
+        record = {
+            "ts": datetime.now().isoformat(),
+            "tenant_id": tenant_id,
+            "phone": phone,
+            "session_id": session_id,
+            "message": message,
+            "response": response,
+            "tool_calls": tool_calls or [],
+            "latency_ms": latency_ms
+        }
+        data = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        key = _key(tenant_id, phone)
+
+        with span("transcript.append"), self._lock:
+            self.open()
+            if self._active_size and self._active_size + len(data) > self.segment_max_bytes:
+                self._rotate()
+
+            offset = self._active_size
+            self._active.write(data)
+            self._active.flush()
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            self._active_size += len(data)
+
+            # El índice va con buffer: si se pierde su cola, la recupera _recover_tail()
+            self._index_out.write(_ENTRY.pack(key, self._active_id, offset, len(data) - 1))
+
+            entries = self._index.get(key)
+            if entries is None:
+                entries = self._index[key] = _Entries()
+            entries.add(self._active_id, offset, len(data) - 1)
+            self.appended += 1
+
+    def _rotate(self):
+        """Sella el segmento activo y abre el siguiente"""
+        # Al abrir solo se recupera la cola del segmento activo: las entradas
+        # del que se sella tienen que quedar escritas antes
+        self._index_out.flush()
+        if self.fsync:
+            os.fsync(self._active.fileno())
+        self._active.close()
+        self._active_id += 1
+        self._active = open(self.directory / _segment_name(self._active_id), "ab")
+        self._active_size = 0
+        self.rotations += 1
+
+    def erase(self, tenant_id: str, phone: str) -> int:
+        """
+        Quita del índice los turnos de un prospecto. Los bytes siguen en los
+        segmentos hasta el próximo compact(). Retorna los turnos borrados.
+        """
+        key = _key(tenant_id, phone)
+        with self._lock:
+            self.open()
+            entries = self._index.pop(key, None)
+            if entries is None:
+                return 0
+            self._index_out.write(_ENTRY.pack(key, _TOMBSTONE, 0, 0))
+            self._index_out.flush()
+            return len(entries)
+
+    # ------------------------------------------------------------------ lectura
+
+    def _read(self, segment_id: int, offset: int, length: int) -> bytes:
+        mapped = self._maps.get(segment_id)
+        if mapped is None or offset + length > len(mapped):
+            # Segmento nuevo para el caché, o el activo creció desde que se mapeó
+            if mapped is not None:
+                mapped.close()
+            with open(self.directory / _segment_name(segment_id), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment_id] = mapped
+            if len(self._maps) > MAX_OPEN_MAPS:
+                self._maps.popitem(last=False)[1].close()
+        self._maps.move_to_end(segment_id)
+        return mapped[offset:offset + length]
+
+    def _close_maps(self):
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
+
+    def _load_turn(self, entries: _Entries, i: int, tenant_id: str, phone: str) -> Optional[Dict[str, Any]]:
+        try:
+            record = json.loads(self._read(*entries.get(i)))
+        except (OSError, ValueError):
+            return None
+        # Colisión de hash (o índice viejo): el turno no es de este prospecto
+        if record.get("tenant_id") != tenant_id or record.get("phone") != phone:
+            return None
+        return record
+
+    def history(
+        self,
+        tenant_id: str,
+        phone: str,
+        limit: int = 50,
+        before: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Turnos de un prospecto en orden cronológico, de a `limit`.
+
+        Args:
+            before: Posición (exclusiva) desde la que se pagina hacia atrás;
+                None para los más recientes. Usar `next_before` de la página anterior.
+
+        Returns:
+            {"turns": [...], "total": turnos archivados, "next_before": posición o None}
+        """
+        with span("transcript.history"), self._lock:
+            self.open()
+            entries = self._index.get(_key(tenant_id, phone))
+            if entries is None:
+                return {"turns": [], "total": 0, "next_before": None}
+
+            end = len(entries) if before is None else max(0, min(before, len(entries)))
+            start = max(0, end - max(limit, 0))
+            turns = []
+            for i in range(start, end):
+                turn = self._load_turn(entries, i, tenant_id, phone)
+                if turn is not None:
+                    turns.append(turn)
+
+            return {"turns": turns, "total": len(entries), "next_before": start or None}
+
+    def iter_history(self, tenant_id: str, phone: str) -> Iterator[Dict[str, Any]]:
+        """Todos los turnos de un prospecto, de a uno (memoria constante)"""
+        with self._lock:
+            self.open()
+            entries = self._index.get(_key(tenant_id, phone))
+            total = len(entries) if entries is not None else 0
+
+        for i in range(total):
+            with self._lock:
+                turn = self._load_turn(entries, i, tenant_id, phone)
+            if turn is not None:
+                yield turn
+
+    # ------------------------------------------------------------------ compactación
+
+    def compact(self, keep_days: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Reescribe los segmentos dejando solo los turnos vivos, agrupados por
+        prospecto (el historial de cada uno queda contiguo en disco).
+        Descarta los turnos borrados con erase() y, con `keep_days`, los más
+        antiguos que ese plazo.
+
+        Bloquea las escrituras y lecturas mientras corre (con el servidor
+        arriba se llama desde POST /admin/transcripts/compact).
+        """
+        start = time.perf_counter()
+        cutoff = (datetime.now() - timedelta(days=keep_days)).isoformat() if keep_days is not None else None
+
+        with self._lock:
+            self.open()
+            if self._active_size:
+                self._rotate()
+            old_ids = self._segment_ids()
+            bytes_before = sum((self.directory / _segment_name(i)).stat().st_size for i in old_ids)
+
+            # Los segmentos nuevos van después de todos los existentes
+            next_id = old_ids[-1] + 1 if old_ids else self._active_id + 1
+            new_ids: List[int] = []
+            new_index: Dict[bytes, _Entries] = {}
+            out = None
+            out_size = 0
+            kept = expired = 0
+
+            index_tmp = self.directory / (INDEX_FILE + COMPACT_SUFFIX)
+            with open(index_tmp, "wb") as index_out:
+                for key, entries in self._index.items():
+                    for i in range(len(entries)):
+                        try:
+                            data = self._read(*entries.get(i))
+                        except OSError:
+                            continue
+                        if cutoff is not None and json.loads(data).get("ts", "") < cutoff:
+                            expired += 1
+                            continue
+
+                        if out is None or out_size + len(data) + 1 > self.segment_max_bytes and out_size:
+                            if out is not None:
+                                self._seal(out)
+                            new_ids.append(next_id)
+                            out = open(self.directory / (_segment_name(next_id) + COMPACT_SUFFIX), "wb")
+                            out_size = 0
+                            next_id += 1
+
+                        out.write(data + b"\n")
+                        index_out.write(_ENTRY.pack(key, new_ids[-1], out_size, len(data)))
+                        entry = new_index.get(key)
+                        if entry is None:
+                            entry = new_index[key] = _Entries()
+                        entry.add(new_ids[-1], out_size, len(data))
+                        out_size += len(data) + 1
+                        kept += 1
+                if out is not None:
+                    self._seal(out)
+                index_out.flush()
+                os.fsync(index_out.fileno())
+
+            manifest = {"segments": new_ids, "remove": old_ids}
+            manifest_path = self.directory / MANIFEST_FILE
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._active.close()
+            self._index_out.close()
+            self._close_maps()
+            self._apply_manifest(manifest)
+
+            self._index = new_index
+            self._active_id = next_id
+            self._active = open(self.directory / _segment_name(self._active_id), "ab")
+            self._active_size = 0
+            self._index_out = open(self.directory / INDEX_FILE, "ab")
+
+            bytes_after = sum((self.directory / _segment_name(i)).stat().st_size for i in new_ids)
+
+        return {
+            "turns_kept": kept,
+            "turns_expired": expired,
+            "segments_before": len(old_ids),
+            "segments_after": len(new_ids),
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "seconds": round(time.perf_counter() - start, 3)
+        }
+
+    @staticmethod
+    def _seal(f):
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+
+    def _apply_manifest(self, manifest: Dict[str, List[int]]):
+        """Instala el resultado de una compactación (idempotente, se puede repetir tras un corte)"""
+        for segment_id in manifest["segments"]:
+            staged = self.directory / (_segment_name(segment_id) + COMPACT_SUFFIX)
+            if staged.exists():
+                os.replace(staged, self.directory / _segment_name(segment_id))
+        staged_index = self.directory / (INDEX_FILE + COMPACT_SUFFIX)
+        if staged_index.exists():
+            os.replace(staged_index, self.directory / INDEX_FILE)
+        for segment_id in manifest["remove"]:
+            (self.directory / _segment_name(segment_id)).unlink(missing_ok=True)
+        (self.directory / MANIFEST_FILE).unlink(missing_ok=True)
+
+    def _finish_compaction(self):
+        """Termina una compactación cortada, o descarta sus archivos si no llegó al manifiesto"""
+        manifest_path = self.directory / MANIFEST_FILE
+        if manifest_path.exists():
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self._apply_manifest(json.load(f))
+            return
+        for staged in self.directory.glob(f"*{COMPACT_SUFFIX}"):
+            staged.unlink()
+
+    # ------------------------------------------------------------------ métricas
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self.open()
+            segments = self._segment_ids()
+            return {
+                "enabled": self.enabled,
+                "prospects": len(self._index),
+                "turns": sum(len(entries) for entries in self._index.values()),
+                "segments": len(segments),
+                "active_segment": self._active_id,
+                "segment_bytes": sum((self.directory / _segment_name(i)).stat().st_size for i in segments),
+                "index_bytes": self._index_out.tell(),
+                "appended": self.appended,
+                "rotations": self.rotations,
+                "recovered": self.recovered
+            }
+
+
+# Instancia compartida por la API
+transcripts = TranscriptArchive.from_env()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archivo de transcripciones")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("stats", help="Prospectos, turnos y tamaño del archivo")
+
+    show_parser = subparsers.add_parser("show", help="Historial de un prospecto (NDJSON)")
+    show_parser.add_argument("tenant_id")
+    show_parser.add_argument("phone")
+    show_parser.add_argument("--limit", type=int, default=None, help="Solo los últimos N turnos")
+
+    erase_parser = subparsers.add_parser("erase", help="Borra el historial de un prospecto")
+    erase_parser.add_argument("tenant_id")
+    erase_parser.add_argument("phone")
+
+    compact_parser = subparsers.add_parser("compact", help="Reescribe los segmentos sin turnos borrados")
+    compact_parser.add_argument("--keep-days", type=float, default=None, help="Descarta turnos más antiguos")
+
+    args = parser.parse_args()
+    try:
+        transcripts.open()
+    except ArchiveLocked as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    if args.command == "stats":
+        print(json.dumps(transcripts.stats(), indent=2))
+    elif args.command == "show":
+        if args.limit is not None:
+            turns = transcripts.history(args.tenant_id, args.phone, limit=args.limit)["turns"]
+        else:
+            turns = transcripts.iter_history(args.tenant_id, args.phone)
+        for turn in turns:
+            sys.stdout.write(json.dumps(turn, ensure_ascii=False) + "\n")
+    elif args.command == "erase":
+        erased = transcripts.erase(args.tenant_id, args.phone)
+        print(f"🗑️  {erased} turnos borrados del índice (corre 'compact' para liberar el espacio)")
+    elif args.command == "compact":
+        result = transcripts.compact(args.keep_days)
+        print(f"✅ Compactación: {result['turns_kept']} turnos conservados, {result['turns_expired']} vencidos")
+        print(f"   Segmentos {result['segments_before']} → {result['segments_after']}, "
+              f"{result['bytes_before'] / 1e6:.1f} MB → {result['bytes_after'] / 1e6:.1f} MB "
+              f"en {result['seconds']} s")